@@ -0,0 +1,371 @@
+"""Кэш в отображаемом в память файле, общий для всех воркеров хоста.
+
+Файл разбит на корзины по WAYS слотов фиксированного размера SLOT_SIZE.
+Ключ попадает в корзину по хэшу; при нехватке места в корзине
+вытесняется самый давно читанный слот (LRU внутри корзины). Операция
+над ключом блокирует только байты своей корзины (fcntl.lockf), поэтому
+воркеры почти не мешают друг другу. Значения, не помещающиеся в слот,
+не кэшируются.
+
+Все процессы, работающие с файлом, должны использовать одинаковые
+MAX_ENTRIES, WAYS и SLOT_SIZE: при расхождении размеченный заново файл
+подменяется переименованием, а процессы со старым отображением
+переоткрывают файл в течение REOPEN_INTERVAL секунд.
+
+Значения хранятся в pickle, поэтому файл и его каталог должны
+принадлежать пользователю процесса и быть недоступны на запись другим:
+иначе бэкенд отказывается с ним работать.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import stat
+import struct
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+from core.metrics import record_cache
+
+MAGIC = b'YTBCACHE'
+VERSION = 1
+# Заголовок файла: сигнатура, версия, число корзин, слотов в корзине,
+# размер слота
+FILE_HEADER = struct.Struct('<8sIIII')
+DATA_OFFSET = 64
+# Заголовок слота: хэш ключа, срок жизни (0 - бессрочно), время
+# последнего чтения, длина ключа (0 - слот пуст), длина значения
+SLOT_HEADER = struct.Struct('<QddHI')
+EMPTY_SLOT = bytes(SLOT_HEADER.size)
+# Как часто процесс проверяет, не подменен ли файл кэша, секунд
+REOPEN_INTERVAL = 1
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def private_directory(path):
+    """Создает каталог кэша и проверяет, что писать в него может только
+    пользователь процесса."""
+    os.makedirs(path, 0o700, exist_ok=True)
+    info = os.stat(path)
+    if info.st_uid != os.geteuid() or info.st_mode & 0o022:
+        raise ImproperlyConfigured(
+            f'Каталог кэша {path} должен принадлежать пользователю '
+            f'процесса и быть закрыт на запись для остальных.'
+        )
+
+
+def open_private(path, flags=os.O_CREAT):
+    """Открывает файл кэша, не следуя по символической ссылке, и
+    проверяет владельца и права."""
+    try:
+        fd = os.open(
+            path, os.O_RDWR | os.O_NOFOLLOW | os.O_CLOEXEC | flags, 0o600
+        )
+    except OSError as error:
+        raise ImproperlyConfigured(
+            f'Не удалось открыть файл кэша {path}: {error}'
+        )
+    info = os.fstat(fd)
+    if (not stat.S_ISREG(info.st_mode) or info.st_uid != os.geteuid()
+            or info.st_mode & 0o077):
+        os.close(fd)
+        raise ImproperlyConfigured(
+            f'Файл кэша {path} должен быть обычным файлом пользователя '
+            f'процесса с правами 0600.'
+        )
+    return open(fd, 'r+b', buffering=0)
+
+
+class SharedFile:
+    """Отображение файла кэша в память одного процесса."""
+
+    def __init__(self, path, buckets, ways, slot_size):
+        self.path = path
+        self.buckets = buckets
+        self.ways = ways
+        self.slot_size = slot_size
+        self.bucket_size = ways * slot_size
+        self.size = DATA_OFFSET + buckets * self.bucket_size
+        # Блокировки fcntl принадлежат процессу, потоки разделяются
+        # обычными блокировками, своей для каждой корзины.
+        self.bucket_locks = [threading.Lock() for _ in range(buckets)]
+        directory = os.path.dirname(path)
+        if directory:
+            private_directory(directory)
+        header = FILE_HEADER.pack(
+            MAGIC, VERSION, buckets, ways, slot_size
+        )
+        while True:
+            self.file = open_private(path)
+            fcntl.lockf(self.file, fcntl.LOCK_EX)
+            try:
+                # Пока ждали блокировку, файл могли подменить
+                current = not self.replaced()
+                fd = self.file.fileno()
+                if current and os.pread(fd, FILE_HEADER.size, 0) == header:
+                    break
+                if current:
+                    self.recreate(header)
+            finally:
+                fcntl.lockf(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        self.checked = time.monotonic()
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+
+    def recreate(self, header):
+        """Подменяет файл новым, размеченным под текущие параметры.
+
+        Старый файл не обрезается: его еще могут читать через отображение
+        другие процессы, а обращение за конец обрезанного файла убивает
+        процесс сигналом SIGBUS.
+        """
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            os.unlink(temporary)
+        except FileNotFoundError:
+            pass
+        with open_private(temporary, os.O_CREAT | os.O_EXCL) as file:
+            os.ftruncate(file.fileno(), self.size)
+            os.pwrite(file.fileno(), header, 0)
+        os.replace(temporary, self.path)
+
+    def replaced(self):
+        """Подменен ли файл по пути другим."""
+        try:
+            return not os.path.samestat(
+                os.fstat(self.file.fileno()), os.lstat(self.path)
+            )
+        except FileNotFoundError:
+            return True
+
+    def stale(self):
+        """Подменен ли файл; проверяется не чаще REOPEN_INTERVAL."""
+        now = time.monotonic()
+        if now - self.checked < REOPEN_INTERVAL:
+            return False
+        self.checked = now
+        return self.replaced()
+
+    def bucket_offset(self, bucket):
+        return DATA_OFFSET + bucket * self.bucket_size
+
+    @contextmanager
+    def lock(self, bucket=None):
+        """Блокирует корзину, а без аргумента - все данные."""
+        with ExitStack() as stack:
+            if bucket is None:
+                start, length = DATA_OFFSET, self.size - DATA_OFFSET
+                # Корзины всегда берутся по возрастанию, взаимной
+                # блокировки с потоками, держащими одну корзину, нет
+                for bucket_lock in self.bucket_locks:
+                    stack.enter_context(bucket_lock)
+            else:
+                start, length = self.bucket_offset(bucket), self.bucket_size
+                stack.enter_context(self.bucket_locks[bucket])
+            fcntl.lockf(self.file, fcntl.LOCK_EX, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.file, fcntl.LOCK_UN, length, start)
+
+
+def shared_file(path, buckets, ways, slot_size):
+    # Экземпляры бэкенда создаются для каждого потока, а отображение
+    # нужно одно на процесс; после fork или подмены файла он
+    # открывается заново. Старое отображение закрывается сборщиком
+    # мусора, когда его перестанут использовать потоки.
+    key = (os.getpid(), path)
+    with _files_lock:
+        if key not in _files or _files[key].stale():
+            _files[key] = SharedFile(path, buckets, ways, slot_size)
+        return _files[key]
+
+
+class MmapCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._ways = int(options.get('WAYS', 8))
+        self._slot_size = int(options.get('SLOT_SIZE', 16384))
+        self._buckets = max(1, -(-self._max_entries // self._ways))
+        self._max_data = self._slot_size - SLOT_HEADER.size
+
+    @property
+    def _file(self):
+        return shared_file(
+            self._path, self._buckets, self._ways, self._slot_size
+        )
+
+    def _hash(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    def _slots(self, shared, bucket):
+        start = shared.bucket_offset(bucket)
+        for way in range(self._ways):
+            offset = start + way * self._slot_size
+            yield offset, SLOT_HEADER.unpack_from(shared.map, offset)
+
+    def _lookup(self, shared, bucket, key_hash, key_bytes, now):
+        """Слот ключа (или None) и слот, который можно занять под него.
+
+        Устаревшие слоты по пути освобождаются.
+        """
+        found, free, oldest = None, None, None
+        for offset, header in self._slots(shared, bucket):
+            slot_hash, expires, accessed, key_len, _ = header
+            if key_len and expires and expires <= now:
+                shared.map[offset:offset + SLOT_HEADER.size] = EMPTY_SLOT
+                key_len = 0
+            if not key_len:
+                free = free or offset
+                continue
+            start = offset + SLOT_HEADER.size
+            if (slot_hash == key_hash
+                    and shared.map[start:start + key_len] == key_bytes):
+                found = offset
+            elif oldest is None or accessed < oldest[1]:
+                oldest = (offset, accessed)
+        victim = found or free or oldest[0]
+        return found, victim
+
+    def _read(self, shared, offset, now):
+        header = list(SLOT_HEADER.unpack_from(shared.map, offset))
+        header[2] = now
+        SLOT_HEADER.pack_into(shared.map, offset, *header)
+        key_len, value_len = header[3:]
+        start = offset + SLOT_HEADER.size + key_len
+        return shared.map[start:start + value_len]
+
+    def _write(self, shared, offset, key_hash, key_bytes, pickled, expires,
+               now):
+        # Пока пишутся данные, слот помечен пустым: если процесс упадет
+        # посреди записи, в кэше не останется наполовину записанного
+        # значения.
+        shared.map[offset:offset + SLOT_HEADER.size] = EMPTY_SLOT
+        start = offset + SLOT_HEADER.size
+        shared.map[start:start + len(key_bytes)] = key_bytes
+        start += len(key_bytes)
+        shared.map[start:start + len(pickled)] = pickled
+        SLOT_HEADER.pack_into(
+            shared.map, offset, key_hash, expires or 0, now,
+            len(key_bytes), len(pickled)
+        )
+
+    def _store(self, key, value, timeout, only_new=False):
+        key_bytes = key.encode()
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        key_hash = self._hash(key)
+        bucket = key_hash % self._buckets
+        shared = self._file
+        with shared.lock(bucket):
+            now = time.time()
+            found, victim = self._lookup(
+                shared, bucket, key_hash, key_bytes, now
+            )
+            if found and only_new:
+                return False
+            if len(key_bytes) + len(pickled) > self._max_data:
+                if found:
+                    shared.map[found:found + SLOT_HEADER.size] = EMPTY_SLOT
+                return False
+            self._write(
+                shared, victim, key_hash, key_bytes, pickled,
+                self.get_backend_timeout(timeout), now
+            )
+            return True
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._store(key, value, timeout, only_new=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._store(key, value, timeout)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        key_hash = self._hash(key)
+        bucket = key_hash % self._buckets
+        shared = self._file
+        with shared.lock(bucket):
+            now = time.time()
+            found, _ = self._lookup(
+                shared, bucket, key_hash, key.encode(), now
+            )
+            record_cache(bool(found))
+            if not found:
+                return default
+            pickled = self._read(shared, found, now)
+        return pickle.loads(pickled)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        key_hash = self._hash(key)
+        bucket = key_hash % self._buckets
+        shared = self._file
+        with shared.lock(bucket):
+            found, _ = self._lookup(
+                shared, bucket, key_hash, key.encode(), time.time()
+            )
+            if not found:
+                return False
+            header = list(SLOT_HEADER.unpack_from(shared.map, found))
+            header[1] = self.get_backend_timeout(timeout) or 0
+            SLOT_HEADER.pack_into(shared.map, found, *header)
+            return True
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        key_hash = self._hash(key)
+        bucket = key_hash % self._buckets
+        shared = self._file
+        with shared.lock(bucket):
+            found, _ = self._lookup(
+                shared, bucket, key_hash, key.encode(), time.time()
+            )
+            if found:
+                shared.map[found:found + SLOT_HEADER.size] = EMPTY_SLOT
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        key_bytes = key.encode()
+        key_hash = self._hash(key)
+        bucket = key_hash % self._buckets
+        shared = self._file
+        with shared.lock(bucket):
+            now = time.time()
+            found, _ = self._lookup(shared, bucket, key_hash, key_bytes, now)
+            if not found:
+                raise ValueError("Key '%s' not found" % key)
+            expires = SLOT_HEADER.unpack_from(shared.map, found)[1]
+            new_value = pickle.loads(self._read(shared, found, now)) + delta
+            self._write(
+                shared, found, key_hash, key_bytes,
+                pickle.dumps(new_value, self.pickle_protocol), expires, now
+            )
+        return new_value
+
+    def clear(self):
+        shared = self._file
+        with shared.lock():
+            for bucket in range(self._buckets):
+                for offset, _ in self._slots(shared, bucket):
+                    shared.map[offset:offset + SLOT_HEADER.size] = EMPTY_SLOT
@@ -0,0 +1,35 @@
+"""Размеры пачек массовых запросов в пределах лимита параметров базы.
+
+Число параметров одного запроса ограничено (features.max_query_params:
+999 для SQLite в Django 2.2, у PostgreSQL лимита нет). Пачка
+bulk_create занимает по параметру на каждое поле строки, запрос
+по пачке id - по параметру на id и несколько на остальные условия.
+"""
+
+from django.db import connections, router
+
+# Параметры запроса по пачке id помимо самих id
+RESERVED_PARAMS = 10
+
+
+def max_query_params(model):
+    """Лимит параметров запроса в базе модели или None."""
+    return connections[router.db_for_write(model)].features.max_query_params
+
+
+def bulk_batch_size(model, size=None):
+    """Пачка bulk_create модели: size, но не больше лимита параметров
+    на число полей строки. Без size - наибольшая допустимая пачка
+    (None, если лимита нет)."""
+    limit = max_query_params(model)
+    if not limit:
+        return size
+    largest = max(limit // len(model._meta.concrete_fields), 1)
+    return min(size, largest) if size else largest
+
+
+def ids_batch_size(model):
+    """Сколько id модели передавать в одном запросе pk__in (None,
+    если лимита нет)."""
+    limit = max_query_params(model)
+    return max(limit - RESERVED_PARAMS, 1) if limit else None
@@ -0,0 +1,137 @@
+"""Чтение с реплик для страниц, которые только читают данные.
+
+Представления, помеченные use_replica, на GET-запросах читают с одной
+из баз DATABASE_REPLICAS, остальные запросы и вся запись идут
+в default. После записи клиент на REPLICA_PIN_SECONDS получает cookie
+и читает с основной базы, пока реплики не догонят ее (свои изменения
+пользователь видит сразу). Попутная запись на GET (сессия, last_login,
+хранилище ключей миниатюр) cookie не выставляет.
+"""
+
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+
+PIN_COOKIE = 'primary_pin'
+PRIMARY = 'default'
+# Приложения, запись в которые на безопасных запросах не привязывает
+# клиента к основной базе: их данные страницы с реплик не читают
+INCIDENTAL_APPS = {'sessions', 'auth', 'thumbnail'}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Как долго помнить, какие реплики доступны, секунд
+CHECK_SECONDS = 5
+
+_available = {}
+
+_state = threading.local()
+
+# Отправляется после синхронизации реплик с зависимостями кэша
+# (core.generations), измененными до нее
+replicas_synced = Signal(providing_args=['dependencies'])
+
+
+def use_replica(view):
+    """Разрешает представлению читать с реплик."""
+    view.use_replica = True
+    return view
+
+
+def find_replicas():
+    """Реплики, с которых можно читать.
+
+    Зеркало основной базы (так реплики настраиваются в тестах)
+    и еще не созданная SQLite-копия пропускаются.
+    """
+    primary = connections[PRIMARY].settings_dict
+    aliases = []
+    for alias in getattr(settings, 'DATABASE_REPLICAS', []):
+        settings_dict = connections[alias].settings_dict
+        if settings_dict is primary:
+            continue
+        if (connections[alias].vendor == 'sqlite'
+                and not os.path.exists(settings_dict['NAME'])):
+            continue
+        aliases.append(alias)
+    return aliases
+
+
+def available_replicas():
+    """find_replicas, перепроверяемый не чаще раза в CHECK_SECONDS:
+    функция вызывается при каждом чтении и инвалидации кэша."""
+    key = tuple(getattr(settings, 'DATABASE_REPLICAS', []))
+    now = time.monotonic()
+    checked, aliases = _available.get(key, (None, None))
+    if checked is None or now - checked >= CHECK_SECONDS:
+        aliases = find_replicas()
+        _available[key] = (now, aliases)
+    return list(aliases)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'use_replica', False) and not getattr(
+            _state, 'wrote', False
+        ):
+            aliases = available_replicas()
+            if aliases:
+                return random.choice(aliases)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        if model._meta.app_label not in INCIDENTAL_APPS:
+            _state.wrote_data = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *getattr(settings, 'DATABASE_REPLICAS', [])}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными при синхронизации
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaMiddleware:
+    """Включает чтение с реплик для помеченных представлений
+    и выставляет cookie привязки к основной базе после записи.
+
+    Должен стоять выше SessionMiddleware, чтобы учитывать и запись
+    сессии.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.use_replica = False
+        _state.wrote = _state.wrote_data = False
+        try:
+            response = self.get_response(request)
+            if _state.wrote_data or (
+                _state.wrote and request.method not in SAFE_METHODS
+            ):
+                response.set_cookie(
+                    PIN_COOKIE, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    samesite='Lax',
+                )
+            return response
+        finally:
+            _state.use_replica = False
+            _state.wrote = _state.wrote_data = False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _state.use_replica = (
+            getattr(view_func, 'use_replica', False)
+            and request.method in ('GET', 'HEAD')
+            and PIN_COOKIE not in request.COOKIES
+        )
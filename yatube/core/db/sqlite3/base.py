@@ -0,0 +1,77 @@
+"""SQLite с настройками для работы нескольких воркеров.
+
+Помимо параметров sqlite3.connect в OPTIONS принимаются:
+
+* pragmas - PRAGMA, выполняемые при открытии соединения (поверх
+  PRAGMAS);
+* transaction_mode - режим BEGIN для transaction.atomic. IMMEDIATE
+  берет блокировку на запись в начале транзакции: конкурирующий
+  писатель ждет busy_timeout, а не получает "database is locked"
+  при попытке повысить блокировку посреди транзакции.
+
+Пакетная вставка пишет строки одним INSERT ... VALUES (...), (...)
+вместо UNION ALL SELECT: тот ограничен 500 строками
+(SQLITE_MAX_COMPOUND_SELECT), и bulk_create с явным batch_size больше
+этого падал с "too many terms in compound SELECT".
+"""
+
+from django.db.backends.sqlite3 import base, operations
+
+PRAGMAS = {
+    # Читатели не блокируют писателя и наоборот
+    'journal_mode': 'wal',
+    # В режиме WAL fsync нужен только при контрольной точке
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    # Отрицательное значение - размер в КиБ
+    'cache_size': -20000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+CACHED_STATEMENTS = 256
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseOperations(operations.DatabaseOperations):
+    def bulk_insert_sql(self, fields, placeholder_rows):
+        values = ', '.join(f'({", ".join(row)})' for row in placeholder_rows)
+        return f'VALUES {values}'
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    ops_class = DatabaseOperations
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        kwargs.setdefault('cached_statements', CACHED_STATEMENTS)
+        return kwargs
+
+    @property
+    def pragmas(self):
+        return {**PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if mode is None:
+            return None
+        mode = mode.upper()
+        if mode not in TRANSACTION_MODES:
+            raise ValueError(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}'
+            )
+        return mode
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.transaction_mode
+        if mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {mode}')
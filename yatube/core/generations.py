@@ -0,0 +1,92 @@
+"""Поколения зависимостей для версионирования ключей кэша.
+
+Каждая зависимость ('posts', 'group:5', 'author:7') хранит в кэше число,
+которое увеличивается при изменении данных. Ключи фрагментов включают
+это число, поэтому после изменения старые фрагменты просто перестают
+читаться и вытесняются по TTL.
+
+Пока работают реплики (core.db.replicas), измененные зависимости еще
+и записываются в журнал: страница, прочитанная с отстающей реплики,
+может снова закэшировать старые данные под новым поколением, поэтому
+после синхронизации реплик они сбрасываются повторно (take_pending).
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from core.db.replicas import available_replicas
+
+PENDING_KEY = 'generation:pending'
+PENDING_SEQUENCE_KEY = 'generation:pending:last'
+PENDING_DONE_KEY = 'generation:pending:done'
+
+
+def generation_key(dependency):
+    return f'generation:{dependency}'
+
+
+def _initial():
+    # После вытеснения счетчика новое значение не совпадет ни с одним
+    # из прежних, и устаревшие фрагменты не оживут.
+    return time.time_ns()
+
+
+def get_generation(dependency):
+    key = generation_key(dependency)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, _initial(), None)
+        value = cache.get(key)
+    return value
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key)
+
+
+def bump(*dependencies, remember=True):
+    """Инвалидирует все фрагменты, зависящие от dependencies.
+
+    remember=False не пишет зависимости в журнал для реплик.
+    """
+    dependencies = set(dependencies)
+    for dependency in dependencies:
+        key = generation_key(dependency)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial(), None)
+    if remember and dependencies and available_replicas():
+        number = _incr(PENDING_SEQUENCE_KEY)
+        cache.set(f'{PENDING_KEY}:{number}', dependencies, None)
+
+
+def bump_on_commit(*dependencies, remember=True):
+    """bump после коммита текущей транзакции.
+
+    Запрос, прочитавший данные до коммита, иначе мог бы закэшировать
+    их уже под новым поколением. Вне транзакции выполняется сразу.
+    """
+    transaction.on_commit(lambda: bump(*dependencies, remember=remember))
+
+
+def take_pending():
+    """Зависимости, измененные с предыдущего вызова."""
+    done = cache.get(PENDING_DONE_KEY, 0)
+    current = cache.get(PENDING_SEQUENCE_KEY, 0)
+    if current < done:
+        # Счетчик журнала был вытеснен и начался заново
+        done = 0
+    keys = [
+        f'{PENDING_KEY}:{number}' for number in range(done + 1, current + 1)
+    ]
+    pending = cache.get_many(keys)
+    cache.delete_many(keys)
+    cache.set(PENDING_DONE_KEY, current, None)
+    return set().union(*pending.values())
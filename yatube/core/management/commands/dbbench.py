@@ -0,0 +1,154 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+# Профиль: движок, OPTIONS и CONN_MAX_AGE
+PROFILES = {
+    'default': ('django.db.backends.sqlite3', {}, 0),
+    'tuned': (
+        'core.db.sqlite3', {'transaction_mode': 'IMMEDIATE'}, 60
+    ),
+}
+SEED_ROWS = 10000
+AUTHORS = 100
+
+SCHEMA = (
+    'CREATE TABLE bench_post (id INTEGER PRIMARY KEY, '
+    'author_id INTEGER NOT NULL, pub_date REAL NOT NULL, text TEXT)',
+    'CREATE INDEX bench_post_author_idx ON bench_post (author_id, pub_date)',
+)
+READ_SQL = (
+    'SELECT id, text FROM bench_post WHERE author_id = %s '
+    'ORDER BY pub_date DESC LIMIT 10'
+)
+COUNT_SQL = 'SELECT COUNT(*) FROM bench_post WHERE author_id = %s'
+INSERT_SQL = (
+    'INSERT INTO bench_post (author_id, pub_date, text) VALUES (%s, %s, %s)'
+)
+
+
+class Worker(threading.Thread):
+    """Поток, который выполняет "запросы" до истечения времени.
+
+    После каждого запроса соединение закрывается по тем же правилам,
+    что и в конце HTTP-запроса, поэтому учитывается CONN_MAX_AGE.
+    """
+
+    def __init__(self, alias, deadline, write):
+        super().__init__()
+        self.alias = alias
+        self.deadline = deadline
+        self.write = write
+        self.done = 0
+        self.errors = 0
+
+    def request(self, number):
+        author = number % AUTHORS
+        connection = connections[self.alias]
+        if not self.write:
+            with connection.cursor() as cursor:
+                cursor.execute(READ_SQL, [author])
+                cursor.fetchall()
+            return
+        # Чтение перед записью в одной транзакции, как при сохранении
+        # поста с обработчиками сигналов
+        with transaction.atomic(using=self.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(COUNT_SQL, [author])
+                cursor.execute(INSERT_SQL, [author, time.time(), 'Текст'])
+
+    def run(self):
+        number = 0
+        while time.monotonic() < self.deadline:
+            number += 1
+            try:
+                self.request(number)
+                self.done += 1
+            except OperationalError:
+                self.errors += 1
+            finally:
+                connections[self.alias].close_if_unusable_or_obsolete()
+        connections[self.alias].close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite со стандартными '
+        'настройками и с core.db.sqlite3.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seconds', type=float, default=5,
+            help='Длительность замера для каждого профиля.'
+        )
+        parser.add_argument(
+            '--readers', type=int, default=4,
+            help='Количество читающих потоков.'
+        )
+        parser.add_argument(
+            '--writers', type=int, default=2,
+            help='Количество пишущих потоков.'
+        )
+
+    def prepare(self, alias, path, engine, options, max_age):
+        connections.databases[alias] = {
+            'ENGINE': engine,
+            'NAME': path,
+            'OPTIONS': options,
+            'CONN_MAX_AGE': max_age,
+        }
+        connections.ensure_defaults(alias)
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            for statement in SCHEMA:
+                cursor.execute(statement)
+            cursor.executemany(INSERT_SQL, [
+                [number % AUTHORS, number, 'Текст']
+                for number in range(SEED_ROWS)
+            ])
+        connection.close()
+
+    def measure(self, alias, options):
+        deadline = time.monotonic() + options['seconds']
+        workers = [
+            Worker(alias, deadline, write=False)
+            for _ in range(options['readers'])
+        ] + [
+            Worker(alias, deadline, write=True)
+            for _ in range(options['writers'])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return {
+            kind: (
+                sum(w.done for w in workers if w.write == write)
+                / options['seconds'],
+                sum(w.errors for w in workers if w.write == write),
+            )
+            for kind, write in (('reads', False), ('writes', True))
+        }
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for name, (engine, db_options, max_age) in PROFILES.items():
+                alias = f'bench_{name}'
+                path = os.path.join(directory, f'{name}.sqlite3')
+                self.prepare(alias, path, engine, db_options, max_age)
+                try:
+                    result = self.measure(alias, options)
+                finally:
+                    del connections.databases[alias]
+                self.stdout.write(
+                    f'{name:8} '
+                    f'чтений/с: {result["reads"][0]:9.1f} '
+                    f'(ошибок {result["reads"][1]}), '
+                    f'записей/с: {result["writes"][0]:9.1f} '
+                    f'(ошибок {result["writes"][1]})'
+                )
@@ -0,0 +1,347 @@
+"""Метрики производительности запросов в формате Prometheus.
+
+MetricsMiddleware для каждого запроса считает число и время SQL-запросов
+(execute_wrapper всех соединений), время отрисовки шаблонов (бэкенд
+TimedDjangoTemplates), попадания и промахи кэша (MmapCache) и общее
+время ответа, и складывает их в агрегаты процесса по имени URL
+(posts:index, posts:profile, ...).
+
+Агрегаты процесса не чаще раза в FLUSH_SECONDS сбрасываются в
+METRICS_DIR/<pid>.json; представление metrics суммирует файлы всех
+воркеров. Счетчики не должны уменьшаться, поэтому при старте воркер
+складывает файлы завершившихся процессов (и файл прежнего владельца
+своего pid) в RETIRED и удаляет их.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import (DjangoTemplates, Template,
+                                             reraise)
+from django.template.exceptions import TemplateDoesNotExist
+
+FLUSH_SECONDS = 1
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNRESOLVED = '<unresolved>'
+# Сумма агрегатов завершившихся процессов
+RETIRED = 'retired.json'
+
+_request = threading.local()
+
+
+class RequestStats:
+    """Счетчики одного запроса."""
+
+    __slots__ = (
+        'queries', 'db_seconds', 'template_seconds', 'cache_hits',
+        'cache_misses',
+    )
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def current():
+    """Счетчики текущего запроса или None вне запроса."""
+    return getattr(_request, 'stats', None)
+
+
+def record_cache(hit):
+    stats = current()
+    if stats is None:
+        return
+    if hit:
+        stats.cache_hits += 1
+    else:
+        stats.cache_misses += 1
+
+
+def _timed_execute(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats = current()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += time.perf_counter() - started
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django с замером времени отрисовки.
+
+    Замеряется только шаблон верхнего уровня: include и extends
+    отрисовываются внутри него.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self
+            )
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _bucket(buckets, value):
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            return index
+    return len(buckets)
+
+
+def _empty_view():
+    return {
+        'requests': {},
+        'latency': [0] * (len(LATENCY_BUCKETS) + 1),
+        'latency_sum': 0.0,
+        'queries': [0] * (len(QUERY_BUCKETS) + 1),
+        'queries_sum': 0,
+        'db_seconds': 0.0,
+        'template_seconds': 0.0,
+        'cache_hits': 0,
+        'cache_misses': 0,
+    }
+
+
+def _merge(total, part):
+    for name, value in part.items():
+        if isinstance(value, dict):
+            target = total.setdefault(name, {})
+            for key, count in value.items():
+                target[key] = target.get(key, 0) + count
+        elif isinstance(value, list):
+            total[name] = [a + b for a, b in zip(total[name], value)]
+        else:
+            total[name] += value
+
+
+def _load(path):
+    try:
+        with open(path) as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return None
+
+
+def _dump(path, views):
+    # Через временный файл: читатель не увидит записанный наполовину
+    with open(f'{path}.tmp', 'w') as stream:
+        json.dump(views, stream)
+    os.replace(f'{path}.tmp', path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def retire(directory):
+    """Складывает агрегаты завершившихся процессов в RETIRED и удаляет
+    их файлы. Вызывается до первой записи файла своего процесса: файл
+    с тем же pid остался от завершившегося процесса."""
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        # Стартующие одновременно воркеры не сложат файл дважды
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired = _load(os.path.join(directory, RETIRED)) or {}
+        dead = []
+        for name in os.listdir(directory):
+            pid = name[:-len('.json')]
+            if not name.endswith('.json') or not pid.isdigit():
+                continue
+            if int(pid) != os.getpid() and _alive(int(pid)):
+                continue
+            path = os.path.join(directory, name)
+            for view, data in (_load(path) or {}).items():
+                _merge(retired.setdefault(view, _empty_view()), data)
+            dead.append(path)
+        if dead:
+            _dump(os.path.join(directory, RETIRED), retired)
+            for path in dead:
+                os.unlink(path)
+
+
+class Registry:
+    """Агрегаты метрик процесса по именам URL."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.flushed = 0.0
+        # Процесс, который уже писал файл; после fork файл новый
+        self.pid = None
+
+    def observe(self, view, status, seconds, stats):
+        with self.lock:
+            data = self.views.get(view)
+            if data is None:
+                data = self.views[view] = _empty_view()
+            status = str(status)
+            data['requests'][status] = data['requests'].get(status, 0) + 1
+            data['latency'][_bucket(LATENCY_BUCKETS, seconds)] += 1
+            data['latency_sum'] += seconds
+            data['queries'][_bucket(QUERY_BUCKETS, stats.queries)] += 1
+            data['queries_sum'] += stats.queries
+            data['db_seconds'] += stats.db_seconds
+            data['template_seconds'] += stats.template_seconds
+            data['cache_hits'] += stats.cache_hits
+            data['cache_misses'] += stats.cache_misses
+        if time.monotonic() - self.flushed >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        """Записывает агрегаты процесса в METRICS_DIR."""
+        directory = settings.METRICS_DIR
+        with self.lock:
+            self.flushed = time.monotonic()
+            payload = json.dumps(self.views)
+        os.makedirs(directory, 0o700, exist_ok=True)
+        if self.pid != os.getpid():
+            retire(directory)
+            self.pid = os.getpid()
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        # Через временный файл: читатель не увидит записанный наполовину
+        with open(f'{path}.tmp', 'w') as stream:
+            stream.write(payload)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """Сумма агрегатов всех процессов."""
+        self.flush()
+        directory = settings.METRICS_DIR
+        total = {}
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            views = _load(os.path.join(directory, name)) or {}
+            for view, data in views.items():
+                _merge(total.setdefault(view, _empty_view()), data)
+        return total
+
+
+registry = Registry()
+
+
+def _histogram(lines, name, view, buckets, counts, total):
+    cumulative = 0
+    for bound, count in zip((*buckets, '+Inf'), counts):
+        cumulative += count
+        lines.append(
+            f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}'
+        )
+    lines.append(f'{name}_sum{{view="{view}"}} {total}')
+    lines.append(f'{name}_count{{view="{view}"}} {cumulative}')
+
+
+METRICS = (
+    ('yatube_requests_total', 'counter', 'Запросы по статусу ответа.'),
+    ('yatube_request_duration_seconds', 'histogram', 'Время ответа.'),
+    ('yatube_db_queries_per_request', 'histogram',
+     'SQL-запросов за запрос.'),
+    ('yatube_db_query_seconds_total', 'counter', 'Время SQL-запросов.'),
+    ('yatube_template_render_seconds_total', 'counter',
+     'Время отрисовки шаблонов.'),
+    ('yatube_cache_requests_total', 'counter',
+     'Чтения кэша по результату.'),
+)
+
+
+def render_text(views):
+    """Агрегаты в текстовом формате Prometheus."""
+    sections = {name: [] for name, _, _ in METRICS}
+    for view in sorted(views):
+        data = views[view]
+        label = view.replace('\\', '\\\\').replace('"', '\\"')
+        for status, count in sorted(data['requests'].items()):
+            sections['yatube_requests_total'].append(
+                f'yatube_requests_total{{view="{label}",status="{status}"}} '
+                f'{count}'
+            )
+        _histogram(
+            sections['yatube_request_duration_seconds'],
+            'yatube_request_duration_seconds', label, LATENCY_BUCKETS,
+            data['latency'], data['latency_sum'],
+        )
+        _histogram(
+            sections['yatube_db_queries_per_request'],
+            'yatube_db_queries_per_request', label, QUERY_BUCKETS,
+            data['queries'], data['queries_sum'],
+        )
+        for name, key in (
+            ('yatube_db_query_seconds_total', 'db_seconds'),
+            ('yatube_template_render_seconds_total', 'template_seconds'),
+        ):
+            sections[name].append(f'{name}{{view="{label}"}} {data[key]}')
+        for result, key in (('hit', 'cache_hits'), ('miss', 'cache_misses')):
+            sections['yatube_cache_requests_total'].append(
+                f'yatube_cache_requests_total{{view="{label}",'
+                f'result="{result}"}} {data[key]}'
+            )
+    lines = []
+    for name, kind, description in METRICS:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(sections[name])
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса; должен стоять первым в MIDDLEWARE,
+    чтобы время ответа включало остальные middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = _request.stats = RequestStats()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_timed_execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _request.stats = None
+        match = getattr(request, 'resolver_match', None)
+        registry.observe(
+            match.view_name if match else UNRESOLVED,
+            response.status_code,
+            time.perf_counter() - started,
+            stats,
+        )
+        return response
@@ -0,0 +1,109 @@
+"""Хранилище файлов с именами по содержимому.
+
+Файл сохраняется под SHA-256 своего содержимого (posts/ab/abcd....jpg),
+поэтому одинаковые загрузки занимают место один раз и имеют одно имя,
+а значит и общие миниатюры. Ссылки на файл считаются в StoredFile:
+save добавляет ссылку, release снимает, и файл удаляется, когда ссылок
+не осталось. Изменение счетчика и переименование готового файла или
+его удаление выполняются в одной транзакции, поэтому параллельные
+загрузка и удаление одного содержимого не теряют файл. Сам файл
+хэшируется и записывается под временным именем до транзакции и
+не держит блокировку записи базы. Файлы, сохраненные до этого
+хранилища, в StoredFile не учтены и никогда не удаляются
+(rebuild_counters учитывает картинки постов).
+"""
+
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, router, transaction
+from django.db.models import F
+
+from core.models import StoredFile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, в котором имя файла - хэш содержимого,
+    а файлы удаляются по счетчику ссылок."""
+
+    def write_temporary(self, directory, content):
+        """Записывает content во временный файл в каталоге хранилища
+        directory; возвращает путь к нему и хэш содержимого."""
+        path = self.path(directory)
+        os.makedirs(path, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(
+            dir=path, prefix='.upload-', suffix='.tmp'
+        )
+        digest = hashlib.sha256()
+        try:
+            with open(fd, 'wb') as stream:
+                content.seek(0)
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    stream.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return temporary, digest.hexdigest()
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = posixpath.split(name)
+        temporary, digest = self.write_temporary(directory, content)
+        extension = os.path.splitext(filename)[1].lower()
+        name = posixpath.join(directory, digest[:2], digest + extension)
+        using = router.db_for_write(StoredFile)
+        try:
+            with transaction.atomic(using=using):
+                updated = StoredFile.objects.using(using).filter(
+                    name=name
+                ).update(refs=F('refs') + 1)
+                if not updated:
+                    try:
+                        with transaction.atomic(using=using):
+                            StoredFile.objects.using(using).create(name=name)
+                    except IntegrityError:
+                        # Ту же запись успела создать параллельная загрузка
+                        StoredFile.objects.using(using).filter(
+                            name=name
+                        ).update(refs=F('refs') + 1)
+                # Файл с таким именем уже содержит те же байты
+                if not self.exists(name):
+                    path = self.path(name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+        return name
+
+    def release(self, name):
+        """Снимает ссылку на файл; возвращает True, если файл удален."""
+        using = router.db_for_write(StoredFile)
+        with transaction.atomic(using=using):
+            stored = StoredFile.objects.using(
+                using
+            ).select_for_update().filter(name=name).first()
+            if stored is None:
+                return False
+            if stored.refs > 1:
+                StoredFile.objects.using(using).filter(name=name).update(
+                    refs=F('refs') - 1
+                )
+                return False
+            stored.delete()
+            self.delete(name)
+        return True
+
+
+content_storage = ContentAddressedStorage()
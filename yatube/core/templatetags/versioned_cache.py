@@ -0,0 +1,51 @@
+from django import template
+from django.templatetags.cache import CacheNode
+
+from core.generations import get_generation
+
+register = template.Library()
+
+
+class GenerationVar:
+    """Часть ключа фрагмента: текущее поколение зависимости."""
+
+    def __init__(self, dependency):
+        self.dependency = dependency
+        self.var = dependency.var
+
+    def resolve(self, context):
+        return get_generation(self.dependency.resolve(context))
+
+
+@register.filter
+def dep(name, key):
+    """Имя зависимости с ключом: {{ 'group'|dep:group.pk }} -> group:5."""
+    return f'{name}:{key}'
+
+
+@register.tag
+def versioned_cache(parser, token):
+    """Кэширует фрагмент до изменения зависимости.
+
+    {% versioned_cache <timeout> <fragment_name> <dependency> [var ...] %}
+
+    Ключ включает поколение dependency (см. core.generations), поэтому
+    TTL может быть большим: после bump() фрагмент перерисуется сразу.
+    """
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 4:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires at least 3 arguments.'
+        )
+    cache_name = None
+    if len(tokens) > 4 and tokens[-1].startswith('using='):
+        cache_name = parser.compile_filter(tokens[-1][len('using='):])
+        tokens = tokens[:-1]
+    vary_on = [GenerationVar(parser.compile_filter(tokens[3]))]
+    vary_on.extend(parser.compile_filter(t) for t in tokens[4:])
+    return CacheNode(
+        nodelist, parser.compile_filter(tokens[1]),
+        tokens[2], vary_on, cache_name,
+    )
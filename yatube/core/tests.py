@@ -1,6 +1,37 @@
-from django.test import TestCase, Client
+import functools
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.paginator import Paginator
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test import TestCase, Client, override_settings
 from http import HTTPStatus
 
+from core import metrics
+from core.cache import DATA_OFFSET, MmapCache, SharedFile
+from core.db import replicas
+from core.db.replicas import PIN_COOKIE, ReplicaMiddleware, use_replica
+from core.db.sqlite3.base import DatabaseWrapper
+from core.generations import bump, take_pending
+from core.models import StoredFile
+from core.storage import ContentAddressedStorage
+from posts.models import Post
+from core.templatetags.pagination import elided_page_range
+
+User = get_user_model()
+
 
 class CoreURLTests(TestCase):
     def setUp(self):
@@ -11,3 +42,428 @@ class CoreURLTests(TestCase):
         response = self.guest_client.get('/bla_bla')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class ElidedPageRangeTests(TestCase):
+    def test_elided_page_range(self):
+        """Навигация показывает края и окно вокруг текущей страницы."""
+        paginator = Paginator(range(100000), 10)
+        cases = {
+            1: [1, 2, 3, None, 10000],
+            5: [1, 2, 3, 4, 5, 6, 7, None, 10000],
+            500: [1, None, 498, 499, 500, 501, 502, None, 10000],
+            10000: [1, None, 9998, 9999, 10000],
+        }
+        for number, expected in cases.items():
+            with self.subTest(number=number):
+                self.assertEqual(
+                    elided_page_range(paginator.page(number)), expected
+                )
+
+    def test_short_page_range_not_elided(self):
+        """Короткий список страниц выводится целиком."""
+        paginator = Paginator(range(30), 10)
+        self.assertEqual(elided_page_range(paginator.page(2)), [1, 2, 3])
+
+
+def _increment(location, options, times):
+    cache = MmapCache(location, {'OPTIONS': options})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class MmapCacheTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.tmp.name, 'cache')
+        self.options = {'MAX_ENTRIES': 16, 'WAYS': 4, 'SLOT_SIZE': 512}
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_cache(self, **options):
+        return MmapCache(
+            self.location, {'OPTIONS': {**self.options, **options}}
+        )
+
+    def test_basic_operations(self):
+        """Значения сохраняются, читаются, удаляются и истекают."""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.assertEqual(self.cache.get('new'), 'value')
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('expired', 'value', 0)
+        self.assertIsNone(self.cache.get('expired'))
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.assertEqual(self.cache.decr('counter'), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('counter'))
+
+    def test_shared_between_instances(self):
+        """Данные видны другим экземплярам, работающим с файлом."""
+        self.cache.set('key', 'value')
+        self.assertEqual(self.make_cache().get('key'), 'value')
+
+    def test_large_value_not_cached(self):
+        """Значение больше слота не кэшируется и вытесняет старое."""
+        self.cache.set('key', 'value')
+        self.cache.set('key', 'x' * 1000)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_lru_eviction(self):
+        """При заполнении корзины вытесняется давно читанный ключ."""
+        cache = self.make_cache(MAX_ENTRIES=2, WAYS=2)
+        cache.set('first', 1)
+        cache.set('second', 2)
+        cache.get('first')
+        cache.set('third', 3)
+        self.assertEqual(cache.get('first'), 1)
+        self.assertIsNone(cache.get('second'))
+        self.assertEqual(cache.get('third'), 3)
+
+    def test_incr_is_atomic_between_processes(self):
+        """Инкременты из нескольких процессов не теряются."""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(
+                target=_increment, args=(self.location, self.options, 200)
+            )
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 800)
+
+    def test_symlink_refused(self):
+        """Файл кэша, подмененный символической ссылкой, не открывается."""
+        target = os.path.join(self.tmp.name, 'target')
+        open(target, 'w').close()
+        os.chmod(target, 0o600)
+        os.symlink(target, self.location)
+        with self.assertRaises(ImproperlyConfigured):
+            self.cache.get('key')
+
+    def test_shared_file_refused(self):
+        """Файл кэша, доступный другим пользователям, не открывается."""
+        open(self.location, 'w').close()
+        os.chmod(self.location, 0o644)
+        with self.assertRaises(ImproperlyConfigured):
+            self.cache.get('key')
+
+    def test_relayout_keeps_old_mapping(self):
+        """Файл с другой разметкой подменяется новым, а не обрезается:
+        старое отображение остается читаемым."""
+        old = SharedFile(self.location, 4, 4, 512)
+        old.map[-1:] = b'x'
+        new = SharedFile(self.location, 1, 1, 512)
+        self.assertEqual(old.map[-1:], b'x')
+        self.assertEqual(os.path.getsize(self.location), new.size)
+        self.assertNotEqual(
+            os.fstat(old.file.fileno()).st_ino,
+            os.fstat(new.file.fileno()).st_ino
+        )
+        old.checked -= 60
+        self.assertTrue(old.stale())
+        self.assertEqual(new.map[DATA_OFFSET:DATA_OFFSET + 1], b'\0')
+
+
+class SQLiteBackendTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'db.sqlite3')
+        self.wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': self.path,
+            'OPTIONS': {
+                'transaction_mode': 'immediate',
+                'pragmas': {'cache_size': -1000},
+            },
+        })
+
+    def tearDown(self):
+        self.wrapper.close()
+        self.tmp.cleanup()
+
+    def test_pragmas(self):
+        """При подключении включаются WAL и заданные PRAGMA."""
+        expected = {
+            'journal_mode': 'wal',
+            'synchronous': 1,
+            'busy_timeout': 5000,
+            'cache_size': -1000,
+        }
+        with self.wrapper.cursor() as cursor:
+            for pragma, value in expected.items():
+                with self.subTest(pragma=pragma):
+                    cursor.execute(f'PRAGMA {pragma}')
+                    self.assertEqual(cursor.fetchone()[0], value)
+
+    def test_transaction_takes_write_lock(self):
+        """Транзакция сразу берет блокировку на запись."""
+        self.wrapper.ensure_connection()
+        self.wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(self.path, timeout=0)
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                other.execute('BEGIN IMMEDIATE')
+        finally:
+            other.close()
+            self.wrapper.connection.rollback()
+
+    def test_bulk_insert_over_compound_select_limit(self):
+        """Пачка bulk_create больше 500 строк пишется одним INSERT."""
+        author = User.objects.create_user(username='BulkAuthor')
+        with self.assertNumQueries(1):
+            Post.objects.bulk_create(
+                [Post(author=author, text=str(i)) for i in range(600)],
+                batch_size=1000,
+            )
+        self.assertEqual(Post.objects.filter(author=author).count(), 600)
+
+
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        # В тестах реплика - зеркало основной базы и не используется
+        for target in ('core.db.replicas', 'core.generations'):
+            patcher = mock.patch(
+                f'{target}.available_replicas', return_value=['replica']
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_view(self, view, request):
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+        middleware = ReplicaMiddleware(get_response)
+        return middleware(request)
+
+    def test_read_only_views_use_replica(self):
+        """Помеченные представления читают с реплики на GET."""
+        def read_view(request):
+            return HttpResponse(router.db_for_read(Post))
+        cases = {
+            (True, 'get'): b'replica',
+            (False, 'get'): b'default',
+            (True, 'post'): b'default',
+        }
+        for (marked, method), expected in cases.items():
+            with self.subTest(marked=marked, method=method):
+                handler = functools.partial(read_view)
+                if marked:
+                    handler = use_replica(handler)
+                request = getattr(self.factory, method)('/')
+                response = self.run_view(handler, request)
+                self.assertEqual(response.content, expected)
+                self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_write_pins_to_primary(self):
+        """После записи чтение идет с основной базы."""
+        @use_replica
+        def view(request):
+            router.db_for_write(Post)
+            return HttpResponse(router.db_for_read(Post))
+        response = self.run_view(view, self.factory.get('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        @use_replica
+        def read_view(request):
+            return HttpResponse(router.db_for_read(Post))
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        response = self.run_view(read_view, request)
+        self.assertEqual(response.content, b'default')
+
+    def test_incidental_write_does_not_pin(self):
+        """Запись сессии на GET не привязывает к основной базе,
+        запись данных и любая запись на POST привязывают."""
+        def session_view(request):
+            router.db_for_write(Session)
+            return HttpResponse()
+
+        def data_view(request):
+            router.db_for_write(Post)
+            return HttpResponse()
+        cases = {
+            (session_view, 'get'): False,
+            (data_view, 'get'): True,
+            (session_view, 'post'): True,
+        }
+        for (view, method), pinned in cases.items():
+            with self.subTest(view=view.__name__, method=method):
+                request = getattr(self.factory, method)('/')
+                response = self.run_view(view, request)
+                self.assertEqual(PIN_COOKIE in response.cookies, pinned)
+
+    def test_pending_dependencies(self):
+        """Измененные зависимости отдаются для повторного сброса
+        после синхронизации реплик."""
+        cache.clear()
+        bump('global', 'group:1')
+        bump('author:2')
+        bump('post:3', remember=False)
+        self.assertEqual(take_pending(), {'global', 'group:1', 'author:2'})
+        self.assertEqual(take_pending(), set())
+
+
+class AvailableReplicasTests(TestCase):
+    def test_available_replicas_cached(self):
+        """Файлы реплик перепроверяются не чаще CHECK_SECONDS."""
+        self.addCleanup(replicas._available.clear)
+        replicas._available.clear()
+        with mock.patch.object(
+            replicas, 'find_replicas', return_value=['replica']
+        ) as find, mock.patch.object(replicas.time, 'monotonic') as now:
+            now.return_value = 100
+            replicas.available_replicas()
+            replicas.available_replicas()
+            self.assertEqual(find.call_count, 1)
+            now.return_value = 100 + replicas.CHECK_SECONDS
+            self.assertEqual(replicas.available_replicas(), ['replica'])
+            self.assertEqual(find.call_count, 2)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(METRICS_DIR=self.tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        patcher = mock.patch.object(metrics, 'registry', metrics.Registry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.client = Client()
+
+    def scrape(self, **extra):
+        response = self.client.get('/metrics/', **extra)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.content.decode().splitlines()
+
+    def test_request_metrics(self):
+        """Запрос учитывается под именем URL со счетчиками SQL,
+        шаблонов и кэша."""
+        self.client.get('/')
+        self.client.get('/')
+        lines = self.scrape()
+        self.assertIn(
+            'yatube_requests_total{view="posts:index",status="200"} 2', lines
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            lines
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="+Inf"} 2', lines
+        )
+        values = {
+            line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in lines if not line.startswith('#')
+        }
+        view = '{view="posts:index"}'
+        self.assertGreater(
+            values[f'yatube_db_queries_per_request_sum{view}'], 0
+        )
+        self.assertGreater(
+            values[f'yatube_template_render_seconds_total{view}'], 0
+        )
+        hits = 'yatube_cache_requests_total{view="posts:index",result="hit"}'
+        self.assertGreater(values[hits], 0)
+
+    def test_workers_are_summed(self):
+        """Агрегаты других воркеров из METRICS_DIR складываются."""
+        self.client.get('/')
+        other = metrics.registry.collect()
+        with open(os.path.join(self.tmp.name, '1.json'), 'w') as stream:
+            json.dump(other, stream)
+        self.assertIn(
+            'yatube_requests_total{view="posts:index",status="200"} 2',
+            self.scrape()
+        )
+
+    def test_finished_workers_retired(self):
+        """Файлы завершившихся процессов складываются в общий файл,
+        сумма счетчиков не уменьшается."""
+        self.client.get('/')
+        views = metrics.registry.collect()
+        process = multiprocessing.get_context('fork').Process(target=int)
+        process.start()
+        process.join()
+        for pid in (process.pid, os.getpid()):
+            path = os.path.join(self.tmp.name, f'{pid}.json')
+            with open(path, 'w') as stream:
+                json.dump(views, stream)
+        patcher = mock.patch.object(metrics, 'registry', metrics.Registry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        lines = self.scrape()
+        self.assertIn(
+            'yatube_requests_total{view="posts:index",status="200"} 2', lines
+        )
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmp.name, f'{process.pid}.json')
+        ))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.tmp.name, metrics.RETIRED)
+        ))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_access(self):
+        """Метрики отдаются только разрешенным адресам с токеном."""
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def test_same_content_stored_once(self):
+        """Одинаковое содержимое получает одно имя и один файл,
+        ссылки считаются."""
+        first = self.storage.save('posts/a.JPG', ContentFile(b'meme'))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'meme'))
+        other = self.storage.save('posts/c.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^posts/\w\w/\w{64}\.jpg$')
+        self.assertEqual(StoredFile.objects.get(name=first).refs, 2)
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(self.storage.path(first)))), 1
+        )
+        # Временные файлы загрузок не остаются
+        self.assertEqual(
+            sorted(os.listdir(self.storage.path('posts'))),
+            sorted({first[6:8], other[6:8]})
+        )
+
+    def test_release_deletes_last_reference(self):
+        """Файл удаляется только вместе с последней ссылкой."""
+        name = self.storage.save('posts/a.jpg', ContentFile(b'meme'))
+        self.storage.save('posts/b.jpg', ContentFile(b'meme'))
+        self.assertFalse(self.storage.release(name))
+        self.assertTrue(self.storage.exists(name))
+        self.assertTrue(self.storage.release(name))
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        # Файлы без учета ссылок не удаляются
+        self.assertFalse(self.storage.release('posts/legacy.jpg'))
@@ -1,9 +1,21 @@
 from django.contrib import admin
 
 from .models import Group, Post, Comment, Follow
+from .search import search_comments, search_posts
 
 
-class PostAdmin(admin.ModelAdmin):
+class FullTextSearchMixin:
+    """Поиск в админке по полнотекстовому индексу вместо
+    LIKE '%term%' по search_fields (они нужны только для поля поиска)."""
+    search_function = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return self.search_function(queryset, search_term), False
+
+
+class PostAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'text',
@@ -13,10 +25,25 @@ class PostAdmin(admin.ModelAdmin):
     )
     list_editable = ('group',)
     search_fields = ('text',)
+    search_function = staticmethod(search_posts)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
 
+class CommentAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'text',
+        'created',
+        'author',
+        'post'
+    )
+    search_fields = ('text',)
+    search_function = staticmethod(search_comments)
+    list_filter = ('created',)
+    empty_value_display = '-пусто-'
+
+
 class FollowAdmin(admin.ModelAdmin):
     list_display = (
         'user',
@@ -30,5 +57,5 @@ class FollowAdmin(admin.ModelAdmin):
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
-admin.site.register(Comment)
+admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
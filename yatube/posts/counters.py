@@ -0,0 +1,100 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from core.models import StoredFile
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def _counts(queryset, field, ids):
+    rows = queryset.filter(**{f'{field}__in': ids}).order_by().values(
+        field
+    ).annotate(total=Count('pk')).values_list(field, 'total')
+    return dict(rows)
+
+
+def rebuild_user_stats(user_ids):
+    """Пересчитывает счетчики пользователей по данным таблиц."""
+    user_ids = list(user_ids)
+    posts = _counts(Post.objects, 'author_id', user_ids)
+    followers = _counts(Follow.objects, 'author_id', user_ids)
+    following = _counts(Follow.objects, 'user_id', user_ids)
+    stats = [
+        UserStats(
+            user_id=pk,
+            posts_count=posts.get(pk, 0),
+            followers_count=followers.get(pk, 0),
+            following_count=following.get(pk, 0),
+        )
+        for pk in user_ids
+    ]
+    existing = set(UserStats.objects.filter(
+        user_id__in=user_ids
+    ).values_list('user_id', flat=True))
+    UserStats.objects.bulk_update(
+        [item for item in stats if item.user_id in existing],
+        ['posts_count', 'followers_count', 'following_count'],
+    )
+    UserStats.objects.bulk_create(
+        [item for item in stats if item.user_id not in existing],
+        ignore_conflicts=True,
+    )
+
+
+def rebuild_comment_counts(posts):
+    """Пересчитывает comments_count для набора постов."""
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values(
+        'post'
+    ).annotate(total=Count('pk')).values('total')
+    posts.update(comments_count=Coalesce(Subquery(comments), 0))
+
+
+def rebuild_image_refs(posts):
+    """Пересчитывает ссылки StoredFile (core.storage) на картинки
+    набора постов по всем постам, например после импорта в обход
+    хранилища."""
+    names = list(posts.exclude(image='').exclude(
+        image__isnull=True
+    ).order_by().values_list('image', flat=True).distinct())
+    counts = _counts(Post.objects, 'image', names)
+    existing = set(StoredFile.objects.filter(
+        name__in=names
+    ).values_list('name', flat=True))
+    stored = [
+        StoredFile(name=name, refs=refs) for name, refs in counts.items()
+    ]
+    StoredFile.objects.bulk_update(
+        [item for item in stored if item.name in existing], ['refs']
+    )
+    StoredFile.objects.bulk_create(
+        [item for item in stored if item.name not in existing],
+        ignore_conflicts=True,
+    )
+
+
+def get_stats(user):
+    """Счетчики пользователя; недостающая строка пересчитывается."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        rebuild_user_stats([user.pk])
+        return UserStats.objects.get(user=user)
+
+
+def change_user_stats(user_id, create=True, **deltas):
+    """Атомарно сдвигает счетчики пользователя на deltas.
+
+    Если строки счетчиков еще нет, она пересчитывается целиком
+    (при create=False, например при каскадном удалении, пропускается).
+    """
+    updated = UserStats.objects.filter(user_id=user_id).update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+    if not updated and create and User.objects.filter(pk=user_id).exists():
+        rebuild_user_stats([user_id])
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=Greatest(F('comments_count') + delta, 0)
+    )
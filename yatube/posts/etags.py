@@ -0,0 +1,81 @@
+"""ETag страниц лент и поста для условных GET-запросов.
+
+Валидатор собирается из поколений зависимостей фрагментного кэша
+(core.generations), которые меняются при правке постов, комментариев,
+групп и авторов, и счетчиков, выводимых вне кэшируемых фрагментов.
+Он стоит не больше одного запроса к базе; если ETag совпал
+с If-None-Match, ответ 304 отдается без выборки постов и рендеринга
+шаблона.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.db.models import BooleanField, Exists, OuterRef, Value
+
+from core.generations import get_generation
+from .models import Follow, Group, Post, User
+
+
+def make_etag(request, *parts):
+    """Слабый ETag страницы для текущего пользователя и параметров
+    запроса (CSRF-токен тоже попадает в HTML, поэтому учитывается)."""
+    parts = (
+        request.user.pk,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        request.GET.urlencode(),
+        *parts,
+    )
+    digest = hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def feed_etag(request, feed, *parts):
+    return make_etag(request, feed, get_generation(feed), *parts)
+
+
+def index_etag(request):
+    return feed_etag(request, 'global')
+
+
+def group_etag(request, slug):
+    group_id = Group.objects.filter(
+        slug=slug
+    ).values_list('pk', flat=True).first()
+    if group_id is None:
+        return None
+    return feed_etag(request, f'group:{group_id}')
+
+
+def profile_etag(request, username):
+    if request.user.is_authenticated:
+        following = Exists(Follow.objects.filter(
+            user=request.user, author=OuterRef('pk')
+        ))
+    else:
+        following = Value(False, output_field=BooleanField())
+    row = User.objects.filter(username=username).annotate(
+        is_following=following
+    ).values_list(
+        'pk', 'stats__posts_count', 'stats__followers_count',
+        'stats__following_count', 'is_following'
+    ).first()
+    if row is None:
+        return None
+    return feed_etag(request, f'author:{row[0]}', *row[1:])
+
+
+def post_etag(request, post_id):
+    row = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id', 'comments_count',
+        'author__stats__posts_count'
+    ).first()
+    if row is None:
+        return None
+    author_id, group_id = row[:2]
+    return make_etag(
+        request, *row[2:],
+        get_generation(f'post:{post_id}'),
+        get_generation(f'author:{author_id}'),
+        get_generation(f'group:{group_id}') if group_id else None,
+    )
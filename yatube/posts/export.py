@@ -0,0 +1,67 @@
+"""Потоковая выгрузка постов и комментариев автора.
+
+Записи читаются через QuerySet.iterator() кусками по chunk_size
+и сразу отдаются строками, поэтому память не растет с числом записей.
+Формат совпадает с входным форматом команды import_data.
+"""
+
+import csv
+import json
+
+from .models import Comment, Post
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+CHUNK_SIZE = 2000
+
+POST_FIELDS = ('id', 'text', 'author_id', 'group_id', 'image', 'pub_date')
+COMMENT_FIELDS = ('id', 'text', 'author_id', 'post_id', 'created')
+CSV_COLUMNS = ('type', *dict.fromkeys(POST_FIELDS + COMMENT_FIELDS))
+
+
+def export_records(author, using=None, chunk_size=CHUNK_SIZE):
+    """Посты автора, затем его комментарии, словарями с полем type."""
+    sources = (
+        ('post', Post.objects.filter(author=author), POST_FIELDS),
+        ('comment', Comment.objects.filter(author=author), COMMENT_FIELDS),
+    )
+    for kind, queryset, fields in sources:
+        if using is not None:
+            queryset = queryset.using(using)
+        rows = queryset.order_by('pk').values_list(*fields)
+        for row in rows.iterator(chunk_size=chunk_size):
+            record = {'type': kind}
+            for name, value in zip(fields, row):
+                if hasattr(value, 'isoformat'):
+                    value = value.isoformat()
+                record[name] = value
+            yield record
+
+
+def render_jsonl(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class _Line:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(records):
+    writer = csv.DictWriter(_Line(), CSV_COLUMNS)
+    yield writer.writeheader()
+    for record in records:
+        yield writer.writerow(record)
+
+
+RENDERERS = {'jsonl': render_jsonl, 'csv': render_csv}
+
+
+def render(records, export_format):
+    """Строки выгрузки в формате export_format (ключ FORMATS)."""
+    return RENDERERS[export_format](records)
@@ -0,0 +1,185 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, router
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+# Сколько последних постов автора попадает в ленту при подписке
+BACKFILL_LIMIT = 1000
+BATCH_SIZE = 1000
+
+
+def _entry(user_id, post):
+    return TimelineEntry(
+        user_id=user_id,
+        post=post,
+        author_id=post.author_id,
+        pub_date=post.pub_date,
+    )
+
+
+def wants_pull(followers_count):
+    """Читать ли посты автора при запросе ленты: у него больше
+    FEED_FANOUT_THRESHOLD подписчиков."""
+    threshold = getattr(settings, 'FEED_FANOUT_THRESHOLD', None)
+    return threshold is not None and followers_count > threshold
+
+
+def pulled_authors(author_ids):
+    """Авторы, чьи посты не раскладываются по лентам, а читаются
+    при запросе ленты (режим записан в UserStats.feed_pulled)."""
+    if not author_ids:
+        return []
+    return list(UserStats.objects.filter(
+        user_id__in=author_ids, feed_pulled=True
+    ).values_list('user_id', flat=True))
+
+
+def sync_modes(author_ids):
+    """Переключает режим ленты авторов по числу подписчиков.
+
+    Записи лент переходящего в чтение при запросе автора удаляются
+    (его посты и так читаются напрямую), а при обратном переходе
+    последние посты автора раскладываются по лентам всех подписчиков,
+    включая посты, опубликованные без раскладки.
+    """
+    stats = UserStats.objects.filter(
+        user_id__in=list(author_ids)
+    ).values_list('user_id', 'followers_count', 'feed_pulled')
+    pushed = []
+    for author_id, followers, pulled in stats:
+        pull = wants_pull(followers)
+        if pull == pulled:
+            continue
+        # Условное обновление: режим переключает только один процесс
+        if not UserStats.objects.filter(
+            user_id=author_id, feed_pulled=pulled
+        ).update(feed_pulled=pull):
+            continue
+        if pull:
+            TimelineEntry.objects.filter(author_id=author_id).delete()
+        else:
+            pushed.append(author_id)
+    if pushed:
+        rebuild_timelines(pushed)
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if pulled_authors([post.author_id]):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (_entry(user_id, post) for user_id in followers.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика последние посты автора."""
+    if pulled_authors([follow.author_id]):
+        return
+    posts = Post.objects.filter(
+        author_id=follow.author_id
+    ).only('pk', 'author_id', 'pub_date')[:BACKFILL_LIMIT]
+    TimelineEntry.objects.bulk_create(
+        [_entry(follow.user_id, post) for post in posts],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def rebuild_timelines(author_ids):
+    """Догружает посты авторов в ленты всех их подписчиков
+    (после массового импорта в обход сигналов).
+
+    Записи создаются одним INSERT ... SELECT на автора, без объектов
+    моделей в Python.
+    """
+    author_ids = list(author_ids)
+    pulled = set(pulled_authors(author_ids))
+    connection = connections[router.db_for_write(TimelineEntry)]
+    with connection.cursor() as cursor:
+        for author_id in author_ids:
+            if author_id in pulled:
+                continue
+            posts = Post.objects.filter(author_id=author_id).values(
+                'pk', 'author_id', 'pub_date'
+            )[:BACKFILL_LIMIT]
+            sql, params = posts.query.sql_with_params()
+            cursor.execute(
+                f'INSERT OR IGNORE INTO {TimelineEntry._meta.db_table} '
+                f'(user_id, post_id, author_id, pub_date) '
+                f'SELECT follow.user_id, post.id, post.author_id, '
+                f'post.pub_date FROM ({sql}) AS post '
+                f'JOIN {Follow._meta.db_table} AS follow '
+                f'ON follow.author_id = post.author_id',
+                params,
+            )
+
+
+def trim(follow):
+    """Убирает из ленты подписчика посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id,
+        author_id=follow.author_id,
+    ).delete()
+
+
+class HybridTimeline:
+    """Лента подписок: записи инбокса пользователя, слитые по дате
+    с постами популярных авторов, которые читаются при запросе.
+
+    Поддерживает count() и срезы, поэтому подходит для Paginator.
+    Без популярных авторов (pulled - пустой none()) срез читает
+    из инбокса только строки страницы.
+    """
+
+    def __init__(self, entries, pulled):
+        self.entries = entries
+        self.pulled = pulled
+
+    def count(self):
+        return self.entries.count() + self.pulled.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        if self.pulled.query.is_empty():
+            return [entry.post for entry in self.entries[key]]
+        stop = key.stop
+        pushed = (entry.post for entry in self.entries[:stop])
+        merged = heapq.merge(
+            pushed,
+            self.pulled[:stop],
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=True,
+        )
+        return list(islice(merged, key.start, stop))
+
+
+def timeline(user):
+    """Лента подписок пользователя."""
+    followed = list(
+        Follow.objects.filter(user=user).values_list('author_id', flat=True)
+    )
+    pulled = pulled_authors(followed)
+    entries = TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    )
+    if not pulled:
+        return HybridTimeline(entries, Post.objects.none())
+    return HybridTimeline(
+        entries.exclude(author_id__in=pulled),
+        Post.objects.filter(author_id__in=pulled).select_related(
+            'author', 'group'
+        ),
+    )
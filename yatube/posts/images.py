@@ -0,0 +1,112 @@
+"""Прием картинок постов.
+
+Формат и размер в пикселях проверяются по заголовку, до декодирования.
+JPEG декодируется сразу в уменьшенном масштабе (draft: 1/2, 1/4 или
+1/8 средствами libjpeg), поворот по EXIF применяется к пикселям,
+метаданные, кроме цветового профиля, не сохраняются. Хранится копия
+со стороной не больше POST_IMAGE_MAX_SIDE, поэтому и миниатюры потом
+строятся из небольшой картинки.
+
+GIF в пределах POST_IMAGE_MAX_SIDE хранится как есть. Больший
+анимированный GIF отклоняется: уменьшение сохранило бы только первый
+кадр. Больший статичный GIF хранится в PNG, где сохраняется
+прозрачность.
+"""
+
+import math
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Формат Pillow: расширение сохраненного файла
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 90},
+    'GIF': {},
+}
+
+
+def draft_size(size, max_side):
+    """Размер картинки, уменьшенной до max_side по большей стороне."""
+    ratio = max_side / max(size)
+    return tuple(math.ceil(side * ratio) for side in size)
+
+
+def check_header(image):
+    """Проверяет формат и число пикселей открытой, но еще
+    не декодированной картинки."""
+    if image.format not in FORMATS:
+        raise ValidationError(
+            'Поддерживаются картинки JPEG, PNG, GIF и WebP.',
+            code='invalid_image_format'
+        )
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Слишком большая картинка: %(pixels).0f Мпикс, '
+            'допустимо не больше %(limit).0f Мпикс.',
+            code='image_too_large',
+            params={
+                'pixels': width * height / 1e6,
+                'limit': settings.POST_IMAGE_MAX_PIXELS / 1e6,
+            },
+        )
+
+
+def ingest(upload):
+    """Копия загруженной картинки для хранения (ContentFile с именем)."""
+    try:
+        return _ingest(upload, settings.POST_IMAGE_MAX_SIDE)
+    except (OSError, SyntaxError, ValueError):
+        # Заголовок прочитан, но данные картинки повреждены
+        raise ValidationError(
+            'Не удалось прочитать картинку.', code='invalid_image'
+        )
+
+
+def _ingest(upload, max_side):
+    upload.seek(0)
+    with Image.open(upload) as image:
+        check_header(image)
+        format_ = image.format
+        if format_ == 'GIF':
+            if max(image.size) <= max_side:
+                # GIF хранится как есть, чтобы не потерять анимацию;
+                # EXIF в GIF не бывает
+                upload.seek(0)
+                return ContentFile(upload.read(), name=upload.name)
+            if getattr(image, 'is_animated', False):
+                raise ValidationError(
+                    'Анимированный GIF должен быть не больше %(max_side)d '
+                    'пикселей по большей стороне.',
+                    code='animation_too_large',
+                    params={'max_side': max_side},
+                )
+            format_ = 'PNG'
+        if max(image.size) > max_side:
+            image.draft('RGB', draft_size(image.size, max_side))
+        icc_profile = image.info.get('icc_profile')
+        picture = ImageOps.exif_transpose(image)
+    if picture.mode == 'P':
+        # Палитра уменьшается только методом ближайшего соседа
+        picture = picture.convert('RGBA')
+    if format_ == 'JPEG' and picture.mode not in ('RGB', 'L'):
+        picture = picture.convert('RGB')
+    picture.thumbnail((max_side, max_side), Image.LANCZOS)
+    # exif_transpose возвращает EXIF в picture.info, а PNG сохраняет
+    # его оттуда, если не передан явно
+    options = {**SAVE_OPTIONS[format_], 'exif': b''}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    buffer = BytesIO()
+    picture.save(buffer, format_, **options)
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return ContentFile(
+        buffer.getvalue(), name=f'{name}.{FORMATS[format_]}'
+    )
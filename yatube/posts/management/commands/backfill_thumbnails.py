@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from core.generations import bump
+from posts import thumbnails
+from posts.models import Post
+from posts.signals import post_feeds
+
+logger = logging.getLogger(__name__)
+
+
+def presets_hash():
+    """Хэш размеров и параметров миниатюр: прогресс, сохраненный
+    при других размерах, не используется."""
+    config = [
+        list(thumbnails.all_variants()), thumbnails.backend.default_options
+    ]
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def render_one(name):
+    """Выполняется в процессе пула: ошибка одной картинки не должна
+    останавливать остальные."""
+    try:
+        return thumbnails.render_missing(name)
+    except Exception:
+        logger.exception('Миниатюры %s не созданы', name)
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает недостающие миниатюры всех размеров и вариантов '
+        '(posts.thumbnails) для картинок постов в пуле процессов. Уже '
+        'созданные миниатюры пропускаются, прерванный запуск '
+        'продолжается с места остановки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов (по умолчанию по числу ядер).'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько постов выбирать из базы за раз.'
+        )
+        parser.add_argument(
+            '--checkpoint', default='backfill_thumbnails.checkpoint',
+            help='Файл прогресса.'
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        self.presets = presets_hash()
+        last_pk, retry = self.read_checkpoint(checkpoint)
+        if last_pk:
+            self.stdout.write(f'Продолжение с поста {last_pk + 1}')
+        self.processed = self.created = 0
+        self.failed = []
+        self.started = time.monotonic()
+        # Дочерние процессы наследуют открытые соединения при fork;
+        # им база не нужна, а общий дескриптор SQLite опасен. Процессы
+        # пула создаются при первой задаче, поэтому она ставится сразу
+        connections.close_all()
+        with ProcessPoolExecutor(options['workers']) as executor:
+            executor.submit(os.getpid).result()
+            # Посты, на которых прошлый запуск споткнулся
+            if retry:
+                self.process(executor, Post.objects.filter(pk__in=retry))
+                self.write_checkpoint(checkpoint, last_pk)
+            while True:
+                chunk = self.process(
+                    executor, Post.objects.filter(pk__gt=last_pk),
+                    options['chunk_size']
+                )
+                if not chunk:
+                    break
+                last_pk = chunk[-1][0]
+                self.write_checkpoint(checkpoint, last_pk)
+                self.report()
+        if self.failed:
+            self.stdout.write(
+                f'Посты с ошибками сохранены в {checkpoint} и будут '
+                f'обработаны при следующем запуске'
+            )
+        elif os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: картинок {self.processed}, создано миниатюр '
+            f'{self.created}, ошибок {len(self.failed)} за '
+            f'{time.monotonic() - self.started:.1f} с'
+        ))
+
+    def process(self, executor, posts, limit=None):
+        """Создает миниатюры картинок первых limit постов по pk;
+        возвращает обработанные (pk, имя картинки, автор, группа)."""
+        chunk = list(
+            posts.exclude(image='').exclude(image=None).order_by('pk')
+            .values_list('pk', 'image', 'author_id', 'group_id', named=True)
+            [:limit]
+        )
+        missing = [
+            post for post in chunk if not thumbnails.is_ready(post.image)
+        ]
+        # Картинки создаются до транзакции: BEGIN IMMEDIATE сразу берет
+        # блокировку на запись, и запись с сайта ждала бы весь пул
+        results = list(executor.map(
+            render_one, [post.image for post in missing], chunksize=8
+        ))
+        with transaction.atomic():
+            rendered = [
+                post for post, result in zip(missing, results)
+                if self.register(post.pk, result)
+            ]
+        # Как в thumbnails.process: наборы вариантов, фрагменты лент
+        # и ETag страниц, закэшированные без миниатюр, выводят оригинал
+        dependencies = set()
+        for post in rendered:
+            thumbnails.forget(post.image)
+            dependencies.update(post_feeds(post), [f'post:{post.pk}'])
+        bump(*dependencies)
+        self.processed += len(chunk)
+        return chunk
+
+    def register(self, pk, result):
+        """Записывает созданные миниатюры; False, если картинка
+        не обработана."""
+        if result is None:
+            self.failed.append(pk)
+            return False
+        name, size, ready, created = result
+        thumbnails.register(name, size, ready)
+        self.created += created
+        return True
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.processed / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{self.processed} картинок, {rate:.0f} картинок/с'
+        )
+
+    def read_checkpoint(self, checkpoint):
+        """Последний обработанный пост и посты с ошибками."""
+        if not os.path.exists(checkpoint):
+            return 0, []
+        with open(checkpoint) as stream:
+            state = json.load(stream)
+        if state.get('presets') != self.presets:
+            self.stdout.write(
+                'Размеры миниатюр изменились, файл прогресса не используется'
+            )
+            return 0, []
+        return state['last_pk'], state.get('failed', [])
+
+    def write_checkpoint(self, checkpoint, last_pk):
+        # Запись через временный файл: прогресс не теряется при сбое
+        # посреди записи
+        with open(f'{checkpoint}.tmp', 'w') as stream:
+            json.dump({
+                'last_pk': last_pk,
+                'presets': self.presets,
+                'failed': self.failed,
+            }, stream)
+        os.replace(f'{checkpoint}.tmp', checkpoint)
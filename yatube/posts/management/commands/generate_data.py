@@ -0,0 +1,286 @@
+import random
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from core.db.batches import bulk_batch_size
+from core.storage import content_storage
+from posts.models import Comment, Follow, Group, Post, User
+
+from .import_data import Affected, kept_dates, rebuild_affected
+
+WORDS = (
+    'утро вечер город море лес дорога дом книга музыка кофе друзья '
+    'работа отпуск погода дождь солнце снег кот собака фото проект '
+    'идея новость история выходные поезд река горы парк сад ужин'
+).split()
+TAGS = (
+    'фото путешествия котики книги музыка спорт еда кино природа '
+    'город работа учеба мысли новости осень лето'
+).split()
+IMAGE_DIR = 'posts/synthetic/'
+
+
+class PowerLaw:
+    """Выбор из values с весом 1 / rank ** alpha: первые значения
+    выбираются намного чаще остальных (распределение Ципфа)."""
+
+    def __init__(self, rng, values, alpha):
+        self.rng = rng
+        self.values = list(values)
+        # Популярные значения не должны совпадать с первыми id
+        rng.shuffle(self.values)
+        self.cum_weights = list(accumulate(
+            1 / rank ** alpha for rank in range(1, len(self.values) + 1)
+        ))
+
+    def sample(self, count=1):
+        return self.rng.choices(
+            self.values, cum_weights=self.cum_weights, k=count
+        )
+
+    def choice(self):
+        return self.sample()[0]
+
+
+def parse_size(value):
+    width, _, height = value.partition('x')
+    try:
+        return int(width), int(height)
+    except ValueError:
+        raise CommandError(f'Размер картинки вида 640x480, а не {value!r}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает синтетические данные: пользователей, группы, посты, '
+        'комментарии, подписки и картинки. Авторство, подписчики и '
+        'комментарии распределены по степенному закону; при одинаковых '
+        '--seed и --until данные совпадают.'
+    )
+
+    def add_arguments(self, parser):
+        counts = {
+            'users': 1000, 'groups': 20, 'posts': 20000,
+            'comments': 50000, 'follows': 20000, 'images': 100,
+        }
+        for name, default in counts.items():
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--author-alpha', type=float, default=1.1,
+            help='Показатель степени для числа постов у авторов.'
+        )
+        parser.add_argument(
+            '--follow-alpha', type=float, default=1.2,
+            help='Показатель степени для числа подписчиков.'
+        )
+        parser.add_argument(
+            '--comment-alpha', type=float, default=1.0,
+            help='Показатель степени для числа комментариев к постам.'
+        )
+        parser.add_argument(
+            '--group-ratio', type=float, default=0.5,
+            help='Доля постов в группах.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределены даты постов.'
+        )
+        parser.add_argument(
+            '--until', type=datetime.fromisoformat,
+            help='Дата последнего поста (по умолчанию начало текущих суток).'
+        )
+        parser.add_argument(
+            '--image-size', type=parse_size, default='640x480'
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.affected = Affected()
+        until = options['until'] or timezone.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        if timezone.is_naive(until):
+            until = timezone.make_aware(until)
+        self.span = timedelta(days=options['days'])
+        self.since = until - self.span
+        self.until = until
+        if options['users'] < 1 and options['posts']:
+            raise CommandError('Для постов нужен хотя бы один пользователь')
+        started = time.monotonic()
+        with kept_dates():
+            users = self.create_users(options['users'])
+            groups = self.create_groups(options['groups'])
+            posts = self.create_posts(options, users, groups)
+            self.create_comments(options, users, posts)
+            self.create_follows(options, users)
+        self.stdout.write('Пересчет счетчиков, лент и индексов')
+        rebuild_affected(self.affected)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'
+        ))
+
+    def first_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def save(self, kind, model, objects):
+        """Создает объекты по мере генерации, по chunk_size
+        в транзакции."""
+        objects = iter(objects)
+        batch_size = bulk_batch_size(model)
+        saved = 0
+        started = time.monotonic()
+        while True:
+            chunk = list(islice(objects, self.chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(chunk, batch_size=batch_size)
+            for obj in chunk:
+                self.affected.add(kind, obj)
+            saved += len(chunk)
+        elapsed = time.monotonic() - started
+        rate = saved / elapsed if elapsed else 0
+        self.stdout.write(f'{kind}: {saved}, {rate:.0f} записей/с')
+
+    def create_users(self, count):
+        first = self.first_id(User)
+        # Хэш неиспользуемого пароля один на всех: make_password дорог
+        password = make_password(None)
+        users = list(range(first, first + count))
+        self.save('user', User, (
+            User(
+                pk=pk, username=f'user_{pk}', password=password,
+                date_joined=self.since,
+            )
+            for pk in users
+        ))
+        return users
+
+    def create_groups(self, count):
+        first = self.first_id(Group)
+        groups = list(range(first, first + count))
+        self.save('group', Group, (
+            Group(
+                pk=pk, title=f'Группа {pk}', slug=f'group-{pk}',
+                description=self.text(),
+            )
+            for pk in groups
+        ))
+        return groups
+
+    def text(self, usernames=()):
+        words = self.rng.choices(WORDS, k=self.rng.randint(5, 40))
+        if self.rng.random() < 0.2:
+            words.append(f'#{self.rng.choice(TAGS)}')
+        if usernames and self.rng.random() < 0.05:
+            words.append(f'@{self.rng.choice(usernames)}')
+        return ' '.join(words).capitalize()
+
+    def post_date(self, index, count):
+        # Даты растут вместе с id, как у постов, созданных на сайте
+        return self.since + self.span * (index + self.rng.random()) / count
+
+    def create_posts(self, options, users, groups):
+        count = options['posts']
+        first = self.first_id(Post)
+        authors = PowerLaw(self.rng, users, options['author_alpha'])
+        group_choice = PowerLaw(self.rng, groups, 1.0) if groups else None
+        with_images = set(self.rng.sample(
+            range(count), min(options['images'], count)
+        ))
+        usernames = [f'user_{pk}' for pk in users]
+        posts = []
+
+        def generate():
+            for index in range(count):
+                post = Post(
+                    pk=first + index,
+                    author_id=authors.choice(),
+                    text=self.text(usernames),
+                    pub_date=self.post_date(index, count),
+                )
+                if group_choice and (
+                    self.rng.random() < options['group_ratio']
+                ):
+                    post.group_id = group_choice.choice()
+                if index in with_images:
+                    post.image = self.image(post.pk, options['image_size'])
+                posts.append((post.pk, post.pub_date))
+                yield post
+
+        self.save('post', Post, generate())
+        return posts
+
+    def image(self, pk, size):
+        """Картинка с цветными фигурами, сохраненная в хранилище."""
+        width, height = size
+        picture = Image.new('RGB', size, self.color())
+        draw = ImageDraw.Draw(picture)
+        for _ in range(8):
+            left, right = sorted(self.rng.randrange(width) for _ in 'xy')
+            top, bottom = sorted(self.rng.randrange(height) for _ in 'xy')
+            draw.ellipse([left, top, right, bottom], fill=self.color())
+        buffer = BytesIO()
+        picture.save(buffer, 'JPEG', quality=85)
+        # Имя по содержимому: повторный запуск не создает копию
+        return content_storage.save(
+            f'{IMAGE_DIR}{pk}.jpg', ContentFile(buffer.getvalue())
+        )
+
+    def color(self):
+        return tuple(self.rng.randrange(256) for _ in range(3))
+
+    def create_comments(self, options, users, posts):
+        if not posts:
+            return
+        first = self.first_id(Comment)
+        targets = PowerLaw(self.rng, posts, options['comment_alpha'])
+
+        def generate():
+            for pk in range(first, first + options['comments']):
+                post_id, pub_date = targets.choice()
+                created = pub_date + timedelta(
+                    seconds=self.rng.randrange(3 * 24 * 3600)
+                )
+                yield Comment(
+                    pk=pk,
+                    post_id=post_id,
+                    author_id=self.rng.choice(users),
+                    text=self.text(),
+                    created=min(created, self.until),
+                )
+
+        self.save('comment', Comment, generate())
+
+    def create_follows(self, options, users):
+        if len(users) < 2:
+            return
+        count = min(options['follows'], len(users) * (len(users) - 1))
+        authors = PowerLaw(self.rng, users, options['follow_alpha'])
+        pairs = set()
+        # У популярных авторов подписчики быстро кончаются, поэтому
+        # попыток с запасом; при нехватке подписок будет меньше
+        for _ in range(count * 20):
+            if len(pairs) >= count:
+                break
+            pair = (self.rng.choice(users), authors.choice())
+            if pair[0] != pair[1]:
+                pairs.add(pair)
+        first = self.first_id(Follow)
+        self.save('follow', Follow, (
+            Follow(pk=pk, user_id=user_id, author_id=author_id)
+            for pk, (user_id, author_id) in enumerate(sorted(pairs), first)
+        ))
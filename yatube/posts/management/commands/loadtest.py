@@ -0,0 +1,352 @@
+import json
+import random
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from posts.models import Group, Post, User
+
+USERNAME = 'loadtest_{}'
+# Сценарий: (нужен вход, вес по умолчанию)
+SCENARIOS = {
+    'browse': (False, 60),
+    'feed': (True, 20),
+    'comment': (True, 10),
+    'follow': (True, 10),
+}
+FOLLOW_BURST = 5
+
+
+def parse_mix(value):
+    """browse=60,feed=20 -> {'browse': 60, 'feed': 20}."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise CommandError(f'Неизвестный сценарий {name!r}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def split_clients(mix, clients):
+    """Делит клиентов на анонимных и вошедших пропорционально весам
+    их сценариев: {нужен вход: (веса сценариев, число клиентов)}.
+
+    Анонимные сценарии выполняются клиентами без сессии, поэтому
+    страницы для гостей и для вошедших измеряются отдельно.
+    """
+    parts = {}
+    for name, weight in mix.items():
+        parts.setdefault(SCENARIOS[name][0], {})[name] = weight
+    if len(parts) == 1:
+        return {login: (part, clients) for login, part in parts.items()}
+    if clients < 2:
+        raise CommandError(
+            'Для анонимных сценариев и сценариев со входом нужно '
+            'хотя бы два клиента'
+        )
+    share = sum(parts[False].values()) / sum(mix.values())
+    anonymous = min(max(round(clients * share), 1), clients - 1)
+    return {
+        False: (parts[False], anonymous),
+        True: (parts[True], clients - anonymous),
+    }
+
+
+def percentile(ordered, share):
+    """Перцентиль по ближайшему рангу отсортированного списка."""
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, round(share * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Targets:
+    """Данные для адресов запросов, прочитанные из базы сервера."""
+
+    def __init__(self, sample=1000):
+        self.groups = list(Group.objects.values_list('slug', flat=True)[
+            :sample
+        ])
+        self.posts = list(Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        )[:sample])
+        self.authors = list(Post.objects.order_by().values_list(
+            'author__username', flat=True
+        ).distinct()[:sample])
+        if not self.posts:
+            raise CommandError('В базе нет постов: сначала generate_data')
+
+
+class Worker(threading.Thread):
+    """Поток-клиент: выполняет сценарии до истечения времени.
+
+    Каждый запрос записывается как (адрес, статус ответа или None при
+    сетевой ошибке, ожидаемый статус, время в секундах).
+    """
+
+    def __init__(self, base_url, deadline, mix, targets, rng, username,
+                 password=None, keep_alive=False):
+        super().__init__()
+        self.base_url = base_url.rstrip('/')
+        self.deadline = deadline
+        self.scenarios = list(mix)
+        self.weights = list(mix.values())
+        self.targets = targets
+        self.rng = rng
+        self.username = username
+        self.password = password
+        self.session = requests.Session()
+        self.keep_alive = keep_alive
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+        self.results = []
+
+    def call(self, endpoint, method, path, expected, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, self.base_url + path, allow_redirects=False,
+                timeout=30, **kwargs
+            )
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, None
+        if not self.keep_alive:
+            # Иначе urllib3 может взять из пула сокет, который сервер
+            # уже закрыл
+            self.session.close()
+        self.results.append(
+            (endpoint, status, expected, time.perf_counter() - started)
+        )
+        return response
+
+    def csrf(self):
+        return {'csrfmiddlewaretoken': self.session.cookies.get('csrftoken')}
+
+    def login(self):
+        self.call('users:login', 'GET', '/auth/login/', 200)
+        self.call('users:login', 'POST', '/auth/login/', 302, data={
+            'username': self.username, 'password': self.password,
+            **self.csrf()
+        })
+
+    def browse(self):
+        page = self.rng.randint(1, 3)
+        self.call('posts:index', 'GET', f'/?page={page}', 200)
+        if self.targets.groups:
+            slug = self.rng.choice(self.targets.groups)
+            self.call('posts:group_list', 'GET', f'/group/{slug}/', 200)
+
+    def feed(self):
+        self.call('posts:follow_index', 'GET', '/follow/', 200)
+
+    def comment(self):
+        post_id = self.rng.choice(self.targets.posts)
+        self.call(
+            'posts:add_comment', 'POST', f'/posts/{post_id}/comment/', 302,
+            data={'text': 'Комментарий нагрузочного теста', **self.csrf()},
+        )
+
+    def follow(self):
+        author = self.rng.choice(self.targets.authors)
+        for _ in range(FOLLOW_BURST):
+            self.call(
+                'posts:profile_follow', 'GET',
+                f'/profile/{author}/follow/', 302
+            )
+            self.call(
+                'posts:profile_unfollow', 'GET',
+                f'/profile/{author}/unfollow/', 302
+            )
+
+    def run(self):
+        if self.username:
+            self.login()
+        # Хотя бы один сценарий выполняется даже при коротком тесте
+        while True:
+            scenario = self.rng.choices(self.scenarios, self.weights)[0]
+            getattr(self, scenario)()
+            if time.monotonic() >= self.deadline:
+                break
+
+
+def summarize(results, seconds):
+    latencies = sorted(result[3] for result in results)
+    errors = sum(
+        1 for _, status, expected, _ in results if status != expected
+    )
+    return {
+        'requests': len(results),
+        'rps': round(len(results) / seconds, 1),
+        'errors': errors,
+        'error_rate': round(errors / len(results), 4) if results else 0,
+        **{
+            f'p{share}_ms': (
+                round(percentile(latencies, share / 100) * 1000, 2)
+                if latencies else None
+            )
+            for share in (50, 95, 99)
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест страниц постов: потоки-клиенты выполняют '
+        'сценарии против запущенного сервера. Команда запускается с теми '
+        'же настройками, что и сервер: адреса берутся из его базы, '
+        'в ней же создаются пользователи loadtest_N. Пароль пользователей '
+        'свой на каждый запуск, после теста они отключаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Адрес сервера.'
+        )
+        parser.add_argument(
+            '--seconds', type=float, default=30,
+            help='Длительность теста.'
+        )
+        parser.add_argument(
+            '--clients', type=int, default=8,
+            help='Количество одновременных клиентов; анонимные сценарии '
+                 'и сценарии со входом делят их по весам.'
+        )
+        parser.add_argument(
+            '--mix', type=parse_mix,
+            default={name: weight for name, (_, weight) in SCENARIOS.items()},
+            help='Веса сценариев: browse=60,feed=20,comment=10,follow=10.'
+        )
+        parser.add_argument(
+            '--keep-alive', action='store_true',
+            help='Переиспользовать соединения. runserver (wsgiref) '
+                 'отвечает на них с задержкой ~40 мс (Nagle и delayed '
+                 'ACK), поэтому по умолчанию соединение на запрос.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--password',
+            help='Пароль пользователей loadtest_N; по умолчанию случайный.'
+        )
+        parser.add_argument(
+            '--output', help='Файл JSON для результатов.'
+        )
+        parser.add_argument(
+            '--compare', help='JSON прошлого запуска для сравнения.'
+        )
+
+    def prepare_users(self, count, password):
+        """Пользователи для сценариев со входом, с паролем этого
+        запуска."""
+        usernames = [USERNAME.format(number) for number in range(count)]
+        existing = set(User.objects.filter(
+            username__in=usernames
+        ).values_list('username', flat=True))
+        for username in usernames:
+            if username not in existing:
+                User.objects.create_user(username)
+        User.objects.filter(username__in=usernames).update(
+            password=make_password(password), is_active=True
+        )
+        return usernames
+
+    def retire_users(self, usernames):
+        """Отключает пользователей после теста: войти под ними
+        больше нельзя."""
+        User.objects.filter(username__in=usernames).update(
+            password=make_password(None), is_active=False
+        )
+
+    def handle(self, *args, **options):
+        mix = options['mix']
+        targets = Targets()
+        split = split_clients(mix, options['clients'])
+        anonymous_mix, anonymous = split.get(False, ({}, 0))
+        logged_in_mix, logged_in = split.get(True, ({}, 0))
+        password = options['password'] or secrets.token_urlsafe(16)
+        usernames = (
+            self.prepare_users(logged_in, password) if logged_in else []
+        )
+        # Потоки работают с сервером по HTTP, соединение с базой им
+        # не нужно: закрываем, чтобы не держать блокировки SQLite
+        connections.close_all()
+        rng = random.Random(options['seed'])
+        deadline = time.monotonic() + options['seconds']
+        workers = [
+            Worker(
+                options['url'], deadline,
+                logged_in_mix if username else anonymous_mix, targets,
+                random.Random(rng.random()), username, password,
+                options['keep_alive'],
+            )
+            for username in [None] * anonymous + usernames
+        ]
+        started = time.monotonic()
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            if usernames:
+                self.retire_users(usernames)
+        seconds = time.monotonic() - started
+        results = [result for worker in workers for result in worker.results]
+        report = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'url': options['url'],
+            'seconds': round(seconds, 2),
+            'clients': options['clients'],
+            'anonymous_clients': anonymous,
+            'keep_alive': options['keep_alive'],
+            'mix': mix,
+            'total': summarize(results, seconds),
+            'endpoints': {
+                endpoint: summarize(
+                    [r for r in results if r[0] == endpoint], seconds
+                )
+                for endpoint in sorted({r[0] for r in results})
+            },
+        }
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as stream:
+                previous = json.load(stream)
+        self.print_report(report, previous)
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump(report, stream, ensure_ascii=False, indent=2)
+
+    def print_report(self, report, previous=None):
+        columns = ('requests', 'rps', 'error_rate', 'p50_ms', 'p95_ms',
+                   'p99_ms')
+        # При сравнении к значению добавляется изменение в процентах
+        width = 18 if previous else 11
+        self.stdout.write(
+            f'{"адрес":24} '
+            + ' '.join(f'{name:>{width}}' for name in columns)
+        )
+        rows = [*report['endpoints'].items(), ('всего', report['total'])]
+        for endpoint, data in rows:
+            cells = []
+            for name in columns:
+                value = data[name]
+                cell = '-' if value is None else f'{value:g}'
+                old = None
+                if previous:
+                    old = (
+                        previous['total'] if endpoint == 'всего'
+                        else previous['endpoints'].get(endpoint, {})
+                    ).get(name)
+                if old and value is not None and name != 'requests':
+                    cell += f' ({(value - old) / old:+.0%})'
+                cells.append(f'{cell:>{width}}')
+            self.stdout.write(f'{endpoint:24} ' + ' '.join(cells))
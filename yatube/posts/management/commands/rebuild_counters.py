@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import feed
+from posts.counters import (rebuild_comment_counts, rebuild_image_refs,
+                            rebuild_user_stats)
+from posts.models import Post, User
+
+
+def chunks(queryset, size):
+    """Разбивает queryset на списки id по возрастанию первичного ключа."""
+    last_pk = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', flat=True
+        )[:size])
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счетчики постов, комментариев, подписок и ссылок '
+        'на картинки и режимы лент авторов (после смены '
+        'FEED_FANOUT_THRESHOLD).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько строк пересчитывать в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        size = options['chunk_size']
+        users = 0
+        for ids in chunks(User.objects.all(), size):
+            with transaction.atomic():
+                rebuild_user_stats(ids)
+                feed.sync_modes(ids)
+            users += len(ids)
+        posts = 0
+        for ids in chunks(Post.objects.all(), size):
+            with transaction.atomic():
+                chunk = Post.objects.filter(pk__in=ids)
+                rebuild_comment_counts(chunk)
+                rebuild_image_refs(chunk)
+            posts += len(ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано пользователей: {users}, постов: {posts}'
+        ))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает миниатюры картинок постов из очереди заданий '
+        '(см. posts.thumbnails).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Проверять очередь каждые N секунд, не завершаясь.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько заданий выбирать за раз.'
+        )
+
+    def drain(self, batch_size):
+        """Обрабатывает очередь до конца."""
+        while True:
+            jobs = list(thumbnails.due_jobs().select_related('post')[
+                :batch_size
+            ])
+            if not jobs:
+                return
+            started = time.monotonic()
+            done = thumbnails.process(jobs)
+            self.stdout.write(
+                f'Миниатюры {done} постов за '
+                f'{time.monotonic() - started:.2f} с'
+            )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        self.drain(options['batch_size'])
+        while interval:
+            time.sleep(interval)
+            self.drain(options['batch_size'])
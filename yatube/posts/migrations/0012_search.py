@@ -0,0 +1,55 @@
+from django.db import migrations
+
+INDEXES = {
+    'posts_post_fts': 'posts_post',
+    'posts_comment_fts': 'posts_comment',
+}
+
+
+def create_sql(index, table):
+    return [
+        f"""CREATE VIRTUAL TABLE {index} USING fts5(
+            text,
+            content='{table}',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {index}_insert
+        AFTER INSERT ON {table} BEGIN
+            INSERT INTO {index} (rowid, text) VALUES (new.id, new.text);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {index}_delete
+        AFTER DELETE ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {index}_update
+        AFTER UPDATE OF text ON {table} WHEN old.text IS NOT new.text BEGIN
+            INSERT INTO {index} ({index}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO {index} (rowid, text) VALUES (new.id, new.text);
+        END""",
+        f"INSERT INTO {index} ({index}) VALUES ('rebuild')",
+    ]
+
+
+def drop_sql(index):
+    return [
+        f'DROP TRIGGER IF EXISTS {index}_insert',
+        f'DROP TRIGGER IF EXISTS {index}_delete',
+        f'DROP TRIGGER IF EXISTS {index}_update',
+        f'DROP TABLE IF EXISTS {index}',
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(create_sql(index, table), drop_sql(index))
+        for index, table in INDEXES.items()
+    ]
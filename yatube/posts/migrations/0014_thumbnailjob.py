@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_tags_mentions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailJob',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='thumbnail_job', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('queued', models.DateTimeField(auto_now=True, verbose_name='Поставлен в очередь')),
+            ],
+            options={
+                'verbose_name': 'Задание миниатюр',
+                'verbose_name_plural': 'Задания миниатюр',
+                'ordering': ['queued'],
+            },
+        ),
+    ]
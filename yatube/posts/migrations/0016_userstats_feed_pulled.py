@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_feed_modes(apps, schema_editor):
+    # Посты популярных авторов до сих пор не раскладывались по лентам,
+    # режим записывается тем же порогом
+    threshold = getattr(settings, 'FEED_FANOUT_THRESHOLD', None)
+    if threshold is None:
+        return
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gt=threshold).update(feed_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_image_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='feed_pulled',
+            field=models.BooleanField(default=False, verbose_name='Посты читаются при запросе ленты'),
+        ),
+        migrations.RunPython(fill_feed_modes, migrations.RunPython.noop),
+    ]
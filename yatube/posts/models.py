@@ -1,5 +1,6 @@
 from django.db import models
 from core.models import CreatedModel
+from core.storage import content_storage
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -27,7 +28,8 @@ class Post(CreatedModel):
         User,
         on_delete=models.CASCADE,
         related_name='posts',
-        verbose_name='Автор'
+        verbose_name='Автор',
+        db_index=False
     )
     group = models.ForeignKey(
         Group,
@@ -36,24 +38,58 @@ class Post(CreatedModel):
         null=True,
         related_name='posts',
         verbose_name='Группы',
-        help_text='Выберите группу'
+        help_text='Выберите группу',
+        db_index=False
     )
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True,
         null=True,
         help_text='Загрузите картинку'
     )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'],
+                name='post_pub_date_id_idx'
+            ),
+            # Ленты автора и группы читаются по индексу в порядке
+            # сортировки; отдельные индексы внешних ключей не нужны.
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_date_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_date_idx'
+            ),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
     def __str__(self) -> str:
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # comments_count меняется только запросами UPDATE
+        # (posts.counters): сохранение прочитанного раньше поста
+        # не должно затирать комментарии, добавленные за это время.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comments_count'
+            ]
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     text = models.TextField(
@@ -70,7 +106,8 @@ class Comment(models.Model):
         Post,
         on_delete=models.CASCADE,
         related_name='comments',
-        verbose_name='Комментарий к посту'
+        verbose_name='Комментарий к посту',
+        db_index=False
     )
     created = models.DateTimeField(
         'Дата комментария',
@@ -79,6 +116,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx'
+            ),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -91,16 +134,26 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='follower',
-        verbose_name='Имя пользователя'
+        verbose_name='Имя пользователя',
+        db_index=False
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='following',
-        verbose_name='Автор поста'
+        verbose_name='Автор поста',
+        db_index=False
     )
 
     class Meta:
+        # Подписки пользователя ищутся по уникальному индексу
+        # (user, author), подписчики автора - по (author, user).
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],
@@ -116,3 +169,185 @@ class Follow(models.Model):
 
     def __str__(self) -> str:
         return f'{self.user} подписан на {self.author}'
+
+
+class UserStats(models.Model):
+    """Счетчики пользователя, которые поддерживаются при записи,
+    чтобы страницы не выполняли COUNT."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    # Режим ленты автора (posts.feed): посты не раскладываются
+    # по лентам подписчиков, а читаются при запросе ленты
+    feed_pulled = models.BooleanField(
+        'Посты читаются при запросе ленты', default=False
+    )
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self) -> str:
+        return f'Статистика {self.user}'
+
+
+class TimelineEntry(models.Model):
+    """Запись ленты подписок: пост автора, доставленный подписчику.
+
+    Заполняется при публикации поста и при подписке, поэтому
+    лента читается одним проходом по индексу (user, pub_date).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор поста'
+    )
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        ordering = ['-pub_date', '-post_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='timeline_entry_is_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='timeline_user_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+    def __str__(self) -> str:
+        return f'{self.post} в ленте {self.user}'
+
+
+class PostTag(models.Model):
+    """Запись индекса хэштегов: пост, в тексте которого есть #tag.
+
+    Лента тега читается одним проходом по индексу (tag, pub_date).
+    """
+    tag = models.CharField('Тег', max_length=100)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='tags',
+        verbose_name='Пост',
+        db_index=False
+    )
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        ordering = ['-pub_date', '-post_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'tag'],
+                name='post_tag_is_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['tag', 'pub_date', 'post'],
+                name='post_tag_date_idx'
+            ),
+        ]
+        verbose_name = 'Тег поста'
+        verbose_name_plural = 'Теги постов'
+
+    def __str__(self) -> str:
+        return f'#{self.tag}'
+
+
+class Mention(models.Model):
+    """Запись индекса упоминаний: пост, в тексте которого есть
+    @username пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='mentions',
+        verbose_name='Упомянутый пользователь',
+        db_index=False
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='mentions',
+        verbose_name='Пост',
+        db_index=False
+    )
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        ordering = ['-pub_date', '-post_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'user'],
+                name='mention_is_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='mention_user_date_idx'
+            ),
+        ]
+        verbose_name = 'Упоминание'
+        verbose_name_plural = 'Упоминания'
+
+    def __str__(self) -> str:
+        return f'@{self.user}'
+
+
+class ThumbnailJob(models.Model):
+    """Пост в очереди на создание миниатюр картинки
+    (см. posts.thumbnails)."""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='thumbnail_job',
+        verbose_name='Пост'
+    )
+    queued = models.DateTimeField('Поставлен в очередь', auto_now=True)
+    attempts = models.PositiveSmallIntegerField(
+        'Неудачных попыток', default=0
+    )
+    error = models.TextField('Последняя ошибка', blank=True)
+    next_attempt = models.DateTimeField(
+        'Следующая попытка', blank=True, null=True
+    )
+
+    class Meta:
+        ordering = ['queued']
+        verbose_name = 'Задание миниатюр'
+        verbose_name_plural = 'Задания миниатюр'
+
+    def __str__(self) -> str:
+        return f'Миниатюры {self.post_id}'
@@ -0,0 +1,228 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+POSTS_PER_PAGE = 10
+COUNT_CACHE_TIMEOUT = 60 * 60
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, date, pk):
+    """Упаковывает позицию (дата, id) в строку для адреса страницы."""
+    raw = f'{direction}{date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор. Для битого курсора возвращает None."""
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(cursor + padding).decode()
+        date, pk = raw[1:].split('|')
+        direction, date, pk = raw[0], parse_datetime(date), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or date is None:
+        return None
+    return direction, date, pk
+
+
+def count_cache_key(feed):
+    return f'posts:count:{feed}'
+
+
+def invalidate_counts(*feeds):
+    """Сбрасывает закэшированное количество постов лент."""
+    cache.delete_many([count_cache_key(feed) for feed in feeds])
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор, который берет количество постов ленты из кэша.
+
+    Ключ ленты: 'global', 'group:<id>' или 'author:<id>'; кэш
+    сбрасывается сигналами при сохранении и удалении постов.
+    С estimate=True для огромной таблицы (больше
+    POSTS_COUNT_ESTIMATE_THRESHOLD строк) вместо COUNT(*) берется
+    оценка по максимальному id.
+    """
+
+    def __init__(self, object_list, per_page, feed=None, estimate=False,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.feed = feed
+        self.estimate = estimate
+
+    def _estimated_count(self):
+        threshold = getattr(settings, 'POSTS_COUNT_ESTIMATE_THRESHOLD', None)
+        if not self.estimate or threshold is None:
+            return None
+        estimate = self.object_list.aggregate(max_pk=Max('pk'))['max_pk']
+        if estimate is not None and estimate > threshold:
+            return estimate
+        return None
+
+    @cached_property
+    def count(self):
+        if self.feed is None:
+            return super().count
+        key = count_cache_key(self.feed)
+        value = cache.get(key)
+        if value is None:
+            value = self._estimated_count()
+            if value is None:
+                value = super().count
+            cache.set(key, value, COUNT_CACHE_TIMEOUT)
+        return value
+
+
+class CursorPage(Page):
+    """Страница курсорного пагинатора.
+
+    Вместо номеров страниц знает только курсоры соседних страниц,
+    поэтому никогда не обращается к paginator.count.
+    """
+    cursor_mode = True
+
+    def __init__(self, object_list, number, paginator,
+                 previous_cursor=None, next_cursor=None):
+        super().__init__(object_list, number, paginator)
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (дата, id) вместо LIMIT/OFFSET.
+
+    Любая страница выбирается одним проходом по индексу
+    начиная с позиции курсора, независимо от глубины.
+    """
+
+    def __init__(self, object_list, per_page,
+                 date_field='pub_date', id_field='pk', **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.date_field = date_field
+        self.id_field = id_field
+
+    def _position(self, obj):
+        date = obj
+        for name in self.date_field.split('__'):
+            date = getattr(date, name)
+        return date, getattr(obj, self.id_field.replace('__', '_'))
+
+    def _ordered(self, queryset, position, date, pk):
+        """Объекты после позиции курсора в порядке индекса."""
+        if position is None:
+            return queryset.order_by(f'-{date}', f'-{pk}')
+        direction, value, key = position
+        if direction == NEXT:
+            return queryset.filter(
+                Q(**{f'{date}__lt': value})
+                | Q(**{date: value, f'{pk}__lt': key})
+            ).order_by(f'-{date}', f'-{pk}')
+        return queryset.filter(
+            Q(**{f'{date}__gt': value})
+            | Q(**{date: value, f'{pk}__gt': key})
+        ).order_by(date, pk)
+
+    def _keyset(self, queryset, position, limit, date, pk):
+        """Выбирает limit объектов после позиции курсора по индексу."""
+        return list(self._ordered(queryset, position, date, pk)[:limit])
+
+    def _fetch(self, position, limit):
+        return self._keyset(
+            self.object_list, position, limit,
+            self.date_field, self.id_field
+        )
+
+    def page(self, cursor):
+        position = decode_cursor(cursor) if cursor else None
+        direction = position[0] if position else NEXT
+        objects = self._fetch(position, self.per_page + 1)
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if direction == PREVIOUS:
+            objects.reverse()
+        previous_cursor = next_cursor = None
+        if objects:
+            if position is not None and (direction == NEXT or has_more):
+                previous_cursor = encode_cursor(
+                    PREVIOUS, *self._position(objects[0])
+                )
+            if direction == PREVIOUS or has_more:
+                next_cursor = encode_cursor(
+                    NEXT, *self._position(objects[-1])
+                )
+        return self._get_page(
+            objects, cursor or 1, self,
+            previous_cursor=previous_cursor, next_cursor=next_cursor
+        )
+
+    def get_page(self, cursor):
+        return self.page(cursor)
+
+    def _get_page(self, *args, **kwargs):
+        return CursorPage(*args, **kwargs)
+
+
+class EntryCursorPaginator(CursorPaginator):
+    """Курсорный пагинатор записей индекса (теги, упоминания):
+    курсор применяется к записям, на странице выводятся их посты."""
+
+    def _fetch(self, position, limit):
+        entries = self._keyset(
+            self.object_list, position, limit, 'pub_date', 'post_id'
+        )
+        return [entry.post for entry in entries]
+
+
+class TimelineCursorPaginator(CursorPaginator):
+    """Курсорный пагинатор гибридной ленты подписок.
+
+    Курсор применяется к обоим источникам ленты (записи инбокса и посты
+    авторов, читаемых при запросе), результаты сливаются по (дата, id).
+    """
+
+    def _fetch(self, position, limit):
+        entries = self._keyset(
+            self.object_list.entries, position, limit, 'pub_date', 'post_id'
+        )
+        pulled = self._keyset(
+            self.object_list.pulled, position, limit, 'pub_date', 'pk'
+        )
+        posts = [entry.post for entry in entries] + pulled
+        posts.sort(
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=position is None or position[0] == NEXT,
+        )
+        return posts[:limit]
+
+
+def paginate(request, object_list, paginator_class=Paginator,
+             cursor_paginator_class=CursorPaginator, **kwargs):
+    """Возвращает страницу ленты в режиме номеров или курсоров.
+
+    Курсорный режим включается параметром ?cursor= или настройкой
+    POSTS_PAGINATION_MODE = 'cursor'; ссылки вида ?page=N работают всегда.
+    kwargs передаются пагинатору по номерам страниц.
+    """
+    cursor = request.GET.get('cursor')
+    mode = getattr(settings, 'POSTS_PAGINATION_MODE', 'offset')
+    if cursor is not None or (mode == 'cursor' and 'page' not in request.GET):
+        paginator = cursor_paginator_class(object_list, POSTS_PER_PAGE)
+        return paginator.get_page(cursor)
+    paginator = paginator_class(object_list, POSTS_PER_PAGE, **kwargs)
+    return paginator.get_page(request.GET.get('page'))
@@ -0,0 +1,132 @@
+"""Полнотекстовый поиск по постам и комментариям.
+
+Тексты индексируются таблицами SQLite FTS5 с внешним содержимым
+(rowid индекса совпадает с id поста или комментария), которые
+обновляются триггерами на posts_post и posts_comment, так что индекс
+не отстает и при массовых операциях в обход сигналов. Создаются
+миграцией 0012_search; триггеры пересоздаются после каждой миграции,
+потому что SQLite удаляет их при пересоздании таблицы.
+"""
+
+import re
+
+from django.db import connections, router
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+POST_INDEX = 'posts_post_fts'
+COMMENT_INDEX = 'posts_comment_fts'
+
+
+def _triggers(index, table):
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS {index}_insert
+        AFTER INSERT ON {table} BEGIN
+            INSERT INTO {index} (rowid, text) VALUES (new.id, new.text);
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {index}_delete
+        AFTER DELETE ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {index}_update
+        AFTER UPDATE OF text ON {table} WHEN old.text IS NOT new.text BEGIN
+            INSERT INTO {index} ({index}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO {index} (rowid, text) VALUES (new.id, new.text);
+        END''',
+    ]
+
+
+TRIGGERS = {
+    POST_INDEX: _triggers(POST_INDEX, 'posts_post'),
+    COMMENT_INDEX: _triggers(COMMENT_INDEX, 'posts_comment'),
+}
+
+MATCHES_SQL = f'''
+    SELECT rowid AS post_id, bm25({POST_INDEX}) AS score
+    FROM {POST_INDEX} WHERE {POST_INDEX} MATCH %s
+    UNION ALL
+    SELECT comment.post_id, bm25({COMMENT_INDEX})
+    FROM {COMMENT_INDEX}
+    JOIN posts_comment AS comment ON comment.id = {COMMENT_INDEX}.rowid
+    WHERE {COMMENT_INDEX} MATCH %s
+'''
+
+
+def create_triggers(connection):
+    """Создает недостающие триггеры существующих индексов."""
+    tables = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        for index, statements in TRIGGERS.items():
+            if index not in tables:
+                continue
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def match_expression(query):
+    """Выражение MATCH: все слова запроса, каждое как начало слова
+    (заменяет морфологию: "пост" найдет "посты")."""
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', query))
+
+
+def _filter(queryset, index, query):
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {index} WHERE {index} MATCH %s', [expression]
+    ))
+
+
+class SearchResults:
+    """Посты, в тексте которых или в одном из комментариев к которым
+    есть все слова запроса, по убыванию релевантности (bm25).
+
+    Поддерживает count() и срезы, поэтому подходит для Paginator.
+    """
+
+    def __init__(self, query):
+        self.expression = match_expression(query)
+
+    def _fetch(self, sql, params):
+        if not self.expression:
+            return []
+        connection = connections[router.db_for_read(Post)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.expression, self.expression, *params])
+            return cursor.fetchall()
+
+    def count(self):
+        rows = self._fetch(
+            f'SELECT COUNT(DISTINCT post_id) FROM ({MATCHES_SQL})', []
+        )
+        return rows[0][0] if rows else 0
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        rows = self._fetch(
+            f'SELECT post_id FROM ({MATCHES_SQL}) GROUP BY post_id '
+            f'ORDER BY MIN(score), post_id DESC LIMIT %s OFFSET %s',
+            [key.stop - start, start],
+        )
+        ids = [post_id for post_id, in rows]
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def search_posts(queryset, query):
+    """Посты queryset, в тексте которых есть все слова запроса."""
+    return _filter(queryset, POST_INDEX, query)
+
+
+def search_comments(queryset, query):
+    """Комментарии queryset, в тексте которых есть все слова запроса."""
+    return _filter(queryset, COMMENT_INDEX, query)
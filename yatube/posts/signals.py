@@ -0,0 +1,177 @@
+from django.db import connections, router, transaction
+from django.db.models.signals import (
+    post_delete, post_migrate, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from core.db.replicas import replicas_synced
+from core.generations import bump_on_commit
+from . import counters, feed, search, tags
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .paginators import invalidate_counts
+
+
+def post_feeds(post, group_ids=()):
+    """Ключи лент, в которые входит пост. Те же имена служат
+    зависимостями фрагментного кэша лент."""
+    feeds = {'global', f'author:{post.author_id}'}
+    feeds.update(
+        f'group:{pk}' for pk in (post.group_id, *group_ids) if pk
+    )
+    return feeds
+
+
+def invalidate_post_counts(post, group_ids=()):
+    """Сбрасывает количество постов лент сразу и повторно после
+    коммита, чтобы параллельный запрос не закэшировал старое значение."""
+    feeds = post_feeds(post, group_ids)
+    invalidate_counts(*feeds)
+    transaction.on_commit(lambda: invalidate_counts(*feeds))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    """У нового пользователя заводятся нулевые счетчики, изменение
+    автора сбрасывает фрагменты лент с его постами."""
+    if created:
+        if not raw:
+            UserStats.objects.get_or_create(user=instance)
+        return
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    groups = Post.objects.filter(
+        author=instance, group__isnull=False
+    ).order_by().values_list('group_id', flat=True).distinct()
+    bump_on_commit(
+        'global', f'author:{instance.pk}',
+        *(f'group:{pk}' for pk in groups)
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """Изменение группы сбрасывает фрагменты лент с ее постами."""
+    authors = Post.objects.filter(
+        group=instance
+    ).order_by().values_list('author_id', flat=True).distinct()
+    bump_on_commit(
+        'global', f'group:{instance.pk}',
+        *(f'author:{pk}' for pk in authors)
+    )
+
+
+def release_image(name):
+    """Снимает ссылку поста на картинку (core/storage.py). Картинка
+    без ссылок удаляется вместе с миниатюрами."""
+    storage = Post._meta.get_field('image').storage
+    if name and storage.release(name):
+        default.kvstore.delete(ImageFile(name, storage))
+
+
+def release_image_on_commit(name):
+    if name:
+        transaction.on_commit(lambda: release_image(name))
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    """Запоминает прежние группу и картинку редактируемого поста."""
+    instance._old_group_id = instance._old_image = None
+    # Файл новой загрузки сохраняется в хранилище позже, при записи поля
+    instance._new_image = bool(instance.image) and not (
+        instance.image._committed
+    )
+    if instance.pk and not raw:
+        instance._old_group_id, instance._old_image = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', 'image').first() or (None, None)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    """Новый пост учитывается в счетчиках и попадает в ленты
+    подписчиков, теги и упоминания поста индексируются."""
+    invalidate_post_counts(instance, [instance._old_group_id])
+    bump_on_commit(
+        *post_feeds(instance, [instance._old_group_id]),
+        f'post:{instance.pk}'
+    )
+    # Новая загрузка добавила ссылку, даже если содержимое то же
+    if instance._old_image and (
+        instance._new_image or instance._old_image != instance.image.name
+    ):
+        release_image_on_commit(instance._old_image)
+    if not raw:
+        tags.index_post(instance, created)
+    if created and not raw:
+        counters.change_user_stats(instance.author_id, posts_count=1)
+        feed.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    release_image_on_commit(instance.image.name)
+    invalidate_post_counts(instance)
+    bump_on_commit(*post_feeds(instance), f'post:{instance.pk}')
+    counters.change_user_stats(
+        instance.author_id, create=False, posts_count=-1
+    )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    bump_on_commit(f'post:{instance.post_id}')
+    if created and not raw:
+        counters.change_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_on_commit(f'post:{instance.post_id}')
+    counters.change_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    """После подписки обновляются счетчики и в ленту догружаются
+    посты автора."""
+    if created and not raw:
+        counters.change_user_stats(instance.author_id, followers_count=1)
+        counters.change_user_stats(instance.user_id, following_count=1)
+        feed.sync_modes([instance.author_id])
+        feed.backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """После отписки обновляются счетчики и посты автора убираются
+    из ленты."""
+    counters.change_user_stats(
+        instance.author_id, create=False, followers_count=-1
+    )
+    counters.change_user_stats(
+        instance.user_id, create=False, following_count=-1
+    )
+    feed.trim(instance)
+    feed.sync_modes([instance.author_id])
+
+
+@receiver(replicas_synced)
+def replicas_synced_handler(sender, dependencies, **kwargs):
+    """Количество постов, посчитанное по отстающей реплике,
+    сбрасывается после синхронизации."""
+    invalidate_counts(*dependencies)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    """SQLite удаляет триггеры поискового индекса, когда миграция
+    пересоздает таблицу постов или комментариев; здесь они
+    восстанавливаются."""
+    if sender.name != 'posts' or not router.allow_migrate(using, 'posts'):
+        return
+    search.create_triggers(connections[using])
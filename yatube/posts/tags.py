@@ -0,0 +1,85 @@
+"""Индекс хэштегов и упоминаний.
+
+При сохранении поста из текста извлекаются #теги и @username,
+и для каждого заводится запись (PostTag, Mention) с датой поста:
+ленты тега и упоминаний читаются только из индекса.
+"""
+
+import re
+
+from core.db.batches import bulk_batch_size
+from .models import Mention, PostTag, User
+
+# Тег длиннее PostTag.tag не обрезается, а не считается тегом
+TAG_RE = re.compile(r'(?<![\w&])#(\w{1,100})(?!\w)')
+MENTION_RE = re.compile(r'(?<![\w@])@([\w.@+-]{1,150})')
+
+
+def extract_tags(text):
+    return {tag.lower() for tag in TAG_RE.findall(text)}
+
+
+def extract_mentions(text):
+    # Точка в конце предложения не относится к имени
+    return {name.rstrip('.') for name in MENTION_RE.findall(text)}
+
+
+def index_post(post, created=False):
+    """Приводит записи индекса поста в соответствие с его текстом."""
+    tags = extract_tags(post.text)
+    names = extract_mentions(post.text)
+    if created and not tags and not names:
+        return
+    if not created:
+        PostTag.objects.filter(post=post).exclude(tag__in=tags).delete()
+    if tags:
+        PostTag.objects.bulk_create(
+            [
+                PostTag(tag=tag, post=post, pub_date=post.pub_date)
+                for tag in tags
+            ],
+            ignore_conflicts=True,
+        )
+    user_ids = list(User.objects.filter(
+        username__in=names
+    ).values_list('pk', flat=True)) if names else []
+    if not created:
+        Mention.objects.filter(post=post).exclude(
+            user_id__in=user_ids
+        ).delete()
+    if user_ids:
+        Mention.objects.bulk_create(
+            [
+                Mention(user_id=pk, post=post, pub_date=post.pub_date)
+                for pk in user_ids
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def index_new_posts(posts, batch_size=None):
+    """Индексирует новые посты пачкой (для массового импорта)."""
+    tags, names = [], {}
+    for post in posts:
+        tags.extend(
+            PostTag(tag=tag, post_id=post.pk, pub_date=post.pub_date)
+            for tag in extract_tags(post.text)
+        )
+        for name in extract_mentions(post.text):
+            names.setdefault(name, []).append(post)
+    users = dict(User.objects.filter(
+        username__in=names
+    ).values_list('username', 'pk')) if names else {}
+    mentions = [
+        Mention(user_id=users[name], post_id=post.pk, pub_date=post.pub_date)
+        for name, mentioned in names.items() if name in users
+        for post in mentioned
+    ]
+    PostTag.objects.bulk_create(
+        tags, batch_size=bulk_batch_size(PostTag, batch_size),
+        ignore_conflicts=True
+    )
+    Mention.objects.bulk_create(
+        mentions, batch_size=bulk_batch_size(Mention, batch_size),
+        ignore_conflicts=True
+    )
@@ -0,0 +1,30 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+MIME_TYPES = {'WEBP': 'image/webp'}
+
+
+def srcset(items):
+    return ', '.join(f'{thumbnail.url} {width}w' for thumbnail, width in items)
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(image, preset):
+    """Картинка поста в размере preset со srcset из готовых вариантов
+    миниатюр и источником WebP, если он есть. Пока миниатюр нет,
+    выводится оригинал; сами миниатюры здесь не создаются
+    (см. posts.thumbnails)."""
+    variants = thumbnails.srcsets(image, preset)
+    fallback = variants.pop(None, None)
+    return {
+        'src': fallback[-1][0].url if fallback else image.url,
+        'srcset': srcset(fallback) if fallback else '',
+        'sources': [
+            (MIME_TYPES[format_], srcset(items))
+            for format_, items in variants.items()
+        ],
+        'sizes': thumbnails.SIZES[preset],
+    }
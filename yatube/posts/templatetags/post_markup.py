@@ -0,0 +1,58 @@
+import re
+
+from django import template
+from django.urls import reverse
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+from posts.models import Post, User
+from posts.tags import MENTION_RE, TAG_RE, extract_mentions
+
+register = template.Library()
+
+MARKUP_RE = re.compile(f'{TAG_RE.pattern}|{MENTION_RE.pattern}')
+
+
+@register.simple_tag
+def mentioned_users(posts):
+    """Имена существующих пользователей, упомянутых в постах (пост или
+    список постов страницы), одним запросом: аргумент фильтра markup."""
+    if isinstance(posts, Post):
+        posts = [posts]
+    names = set()
+    for post in posts:
+        names.update(extract_mentions(post.text))
+    if not names:
+        return set()
+    return set(User.objects.filter(
+        username__in=names
+    ).values_list('username', flat=True))
+
+
+@register.filter
+def markup(text, users=()):
+    """Экранирует текст поста, превращая #теги и @упоминания
+    в ссылки на ленту тега и профиль. Ссылки ставятся только
+    на пользователей из users (см. mentioned_users)."""
+    parts = []
+    last = 0
+    for match in MARKUP_RE.finditer(text):
+        parts.append(escape(text[last:match.start()]))
+        tag, name = match.groups()
+        if tag:
+            parts.append(format_html(
+                '<a href="{}">#{}</a>',
+                reverse('posts:tag_feed', args=[tag.lower()]), tag
+            ))
+        elif name.rstrip('.') not in users:
+            parts.append(escape(match.group()))
+        else:
+            username = name.rstrip('.')
+            parts.append(format_html(
+                '<a href="{}">@{}</a>{}',
+                reverse('posts:profile', args=[username]), username,
+                name[len(username):]
+            ))
+        last = match.end()
+    parts.append(escape(text[last:]))
+    return mark_safe(''.join(parts))
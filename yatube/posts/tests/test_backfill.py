@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from sorl.thumbnail.models import KVStore
+
+from core.generations import get_generation
+from posts import thumbnails
+from posts.management.commands.backfill_thumbnails import presets_hash
+from posts.models import Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+User = get_user_model()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class BackfillThumbnailsTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='Archive')
+        self.posts = []
+        for number in range(4):
+            buffer = BytesIO()
+            Image.new('RGB', (40, 30), (number * 60, 0, 0)).save(
+                buffer, 'JPEG'
+            )
+            name = default_storage.save(
+                f'posts/backfill_{number}.jpg', ContentFile(buffer.getvalue())
+            )
+            self.posts.append(Post.objects.create(
+                author=author, text=f'Пост {number}', image=name
+            ))
+        Post.objects.create(author=author, text='Без картинки')
+        self.checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'backfill.checkpoint')
+
+    def backfill(self):
+        out = StringIO()
+        call_command(
+            'backfill_thumbnails', workers=2, chunk_size=3,
+            checkpoint=self.checkpoint, stdout=out
+        )
+        return out.getvalue()
+
+    def test_renders_all_presets(self):
+        """Для каждой картинки создаются миниатюры всех размеров,
+        выводится скорость в картинках в секунду."""
+        output = self.backfill()
+        for post in self.posts:
+            for preset in thumbnails.PRESETS:
+                with self.subTest(post=post.pk, preset=preset):
+                    self.assertIsNotNone(
+                        thumbnails.lookup(post.image, preset)
+                    )
+        self.assertIn('картинок/с', output)
+        self.assertIn(
+            f'создано миниатюр {4 * len(list(thumbnails.all_variants()))}',
+            output
+        )
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_cached_pages_invalidated(self):
+        """Закэшированный без миниатюр набор вариантов сбрасывается,
+        поколения поста и его лент растут."""
+        post = self.posts[0]
+        self.assertEqual(thumbnails.srcsets(post.image, 'card'), {})
+        dependencies = [
+            f'post:{post.pk}', f'author:{post.author_id}', 'global'
+        ]
+        before = [get_generation(name) for name in dependencies]
+        self.backfill()
+        self.assertIn(None, thumbnails.srcsets(post.image, 'card'))
+        for name, generation in zip(dependencies, before):
+            with self.subTest(dependency=name):
+                self.assertGreater(get_generation(name), generation)
+
+    def test_skips_existing(self):
+        """Повторный запуск не создает миниатюры заново, в том числе
+        когда о файлах не знает хранилище ключей."""
+        self.backfill()
+        KVStore.objects.all().delete()
+        cache.clear()
+        self.assertIn('создано миниатюр 0', self.backfill())
+        self.assertIsNotNone(thumbnails.lookup(self.posts[0].image, 'card'))
+
+    def write_checkpoint(self, **state):
+        with open(self.checkpoint, 'w') as stream:
+            json.dump({'presets': presets_hash(), **state}, stream)
+
+    def test_resumes_from_checkpoint(self):
+        """Посты до сохраненного в файле прогресса пропускаются."""
+        self.write_checkpoint(last_pk=self.posts[1].pk)
+        output = self.backfill()
+        self.assertIn(f'Продолжение с поста {self.posts[1].pk + 1}', output)
+        self.assertIsNone(thumbnails.lookup(self.posts[0].image, 'card'))
+        self.assertIsNotNone(thumbnails.lookup(self.posts[3].image, 'card'))
+
+    def test_checkpoint_of_other_presets_ignored(self):
+        """Прогресс, сохраненный при других размерах миниатюр,
+        не используется."""
+        self.write_checkpoint(last_pk=self.posts[1].pk)
+        with open(self.checkpoint) as stream:
+            state = json.load(stream)
+        state['presets'] = 'other'
+        with open(self.checkpoint, 'w') as stream:
+            json.dump(state, stream)
+        self.assertIn('файл прогресса не используется', self.backfill())
+        self.assertIsNotNone(thumbnails.lookup(self.posts[0].image, 'card'))
+
+    def test_failed_posts_retried(self):
+        """Посты с ошибками остаются в файле прогресса и обрабатываются
+        при следующем запуске."""
+        broken = self.posts[1]
+        content = default_storage.open(broken.image.name).read()
+        default_storage.delete(broken.image.name)
+        output = self.backfill()
+        self.assertIn('ошибок 1', output)
+        with open(self.checkpoint) as stream:
+            self.assertEqual(json.load(stream)['failed'], [broken.pk])
+        self.assertIsNone(thumbnails.lookup(broken.image, 'card'))
+        default_storage.save(broken.image.name, ContentFile(content))
+        self.assertIn('ошибок 0', self.backfill())
+        self.assertIsNotNone(thumbnails.lookup(broken.image, 'card'))
+        self.assertFalse(os.path.exists(self.checkpoint))
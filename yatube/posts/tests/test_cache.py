@@ -1,53 +1,97 @@
 from django.urls import reverse
-from django.test import TestCase, Client
+from django.test import TransactionTestCase
 from django.contrib.auth import get_user_model
 from posts.models import Post, Group
 from django.core.cache import cache
+from django.db import transaction
 
 User = get_user_model()
 
 
-class PostIndexCacheTest(TestCase):
-    @classmethod
-    def setUpClass(cls):
-        super().setUpClass()
-        cls.user = User.objects.create_user(username='Art')
-        cls.group = Group.objects.create(
+class PostIndexCacheTest(TransactionTestCase):
+    """Фрагменты сбрасываются после коммита, поэтому тесты
+    выполняются без общей транзакции TestCase."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Art')
+        self.group = Group.objects.create(
             title='Тестовая группа',
             slug='Тестовый слаг',
             description='Тестовое описание'
         )
-        cls.post = Post.objects.create(
-            author=cls.user,
-            text='Тестовый текст для поста'
+        self.feed_group = Group.objects.create(
+            title='Группа ленты',
+            slug='cache-slug',
+            description='Тестовое описание'
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Тестовый текст для поста',
+            group=self.feed_group
         )
+        cache.clear()
 
     def test_index_cache(self):
         """Проверка работы кэша на странице index."""
-        # Посчитали количество постов
-        posts_count_before = Post.objects.all().count()
         # Сделали запрос
         response_post_before = self.client.get(reverse('posts:index'))
         # Результат запроса сохранили в переменную
         content_post_before = response_post_before.content
-        # Удалили пост
-        Post.objects.filter(pk=self.post.pk).delete()
+        # Поменяли текст в обход сигналов: кэш об этом не знает
+        Post.objects.filter(pk=self.post.pk).update(text='Другой текст')
         # Снова сделали запрос
         response_post_after = self.client.get(reverse('posts:index'))
-        # Снова сохранили результат запроса в переменную
-        content_post_after = response_post_after.content
-        # Снова посчитали количество постов
-        posts_count_after = Post.objects.all().count()
-        # Сравнили, что количество постов до != количеству после
-        self.assertNotEqual(posts_count_before, posts_count_after)
         # Сравнили, что пост отображается с тем же контентом - кэш работает
-        self.assertEqual(content_post_before, content_post_after)
+        self.assertEqual(content_post_before, response_post_after.content)
 
         # Почистили кэш
         cache.clear()
         # Сделали новый запрос
         response_post_now = self.client.get(reverse('posts:index'))
-        # Сохранили контент запроса в переменную
-        content_post_now = response_post_now
         # Сравнили, что пост отображается с другим контентом - кэш был удален
-        self.assertNotEqual(content_post_now, content_post_before)
+        self.assertNotEqual(response_post_now.content, content_post_before)
+
+    def test_cache_invalidated_on_changes(self):
+        """Фрагменты лент сбрасываются при изменении поста,
+        группы и автора."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={
+                'slug': self.feed_group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        for url in urls:
+            self.client.get(url)
+        # Изменили пост через модель: фрагменты перерисованы
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст поста'
+        post.save()
+        for url in urls:
+            with self.subTest(url=url, change='post'):
+                self.assertContains(self.client.get(url), 'Новый текст поста')
+        # Изменили автора через модель
+        self.user.first_name = 'Новое имя автора'
+        self.user.save()
+        for url in urls:
+            with self.subTest(url=url, change='author'):
+                self.assertContains(self.client.get(url), 'Новое имя автора')
+        # Изменили группу: поменялась ссылка на нее в ленте
+        self.feed_group.slug = 'new-slug'
+        self.feed_group.save()
+        self.assertContains(
+            self.client.get(reverse('posts:index')), '/group/new-slug/'
+        )
+
+    def test_invalidated_after_commit(self):
+        """Фрагменты сбрасываются только после коммита: страница,
+        отрисованная до него, не попадает в кэш под новым поколением."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        with transaction.atomic():
+            post = Post.objects.get(pk=self.post.pk)
+            post.text = 'Текст из транзакции'
+            post.save()
+            self.assertNotContains(
+                self.client.get(url), 'Текст из транзакции'
+            )
+        self.assertContains(self.client.get(url), 'Текст из транзакции')
@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.http import StreamingHttpResponse
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from posts.export import POST_FIELDS
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='ExportArt')
+        cls.other = User.objects.create_user(username='ExportOther')
+        cls.group = Group.objects.create(
+            title='Группа', slug='export-group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост, "с" запятой'
+        )
+        cls.foreign_post = Post.objects.create(
+            author=cls.other, text='Чужой пост'
+        )
+        cls.comment = Comment.objects.create(
+            post=cls.foreign_post, author=cls.author, text='Коммент'
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.other, text='Чужой коммент'
+        )
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.url = reverse(
+            'posts:profile_export', kwargs={'username': self.author.username}
+        )
+
+    def test_jsonl(self):
+        """Выгружаются посты и комментарии автора построчно."""
+        response = self.author_client.get(self.url)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(records, [
+            {
+                'type': 'post', 'id': self.post.pk, 'text': self.post.text,
+                'author_id': self.author.pk, 'group_id': self.group.pk,
+                'image': '', 'pub_date': self.post.pub_date.isoformat(),
+            },
+            {
+                'type': 'comment', 'id': self.comment.pk, 'text': 'Коммент',
+                'author_id': self.author.pk, 'post_id': self.foreign_post.pk,
+                'created': self.comment.created.isoformat(),
+            },
+        ])
+
+    def test_csv(self):
+        """CSV содержит колонку type и общие для всех записей колонки."""
+        response = self.author_client.get(self.url, {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(
+            [(row['type'], row['text']) for row in rows],
+            [('post', self.post.text), ('comment', 'Коммент')]
+        )
+        self.assertEqual(rows[1]['group_id'], '')
+
+    def test_access(self):
+        """Чужие данные не выгружаются, неизвестный формат - 404."""
+        client = Client()
+        client.force_login(self.other)
+        response = client.get(self.url)
+        self.assertRedirects(response, reverse(
+            'posts:profile', kwargs={'username': self.author.username}
+        ))
+        response = self.author_client.get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_command_round_trip(self):
+        """Выгрузка команды загружается обратно командой import_data."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.csv')
+            call_command(
+                'export_data', self.author.username, export_format='csv',
+                output=path, chunk_size=1
+            )
+            posts = Post.objects.filter(author=self.author)
+            expected = list(posts.values(*POST_FIELDS))
+            Post.objects.filter(author=self.author).delete()
+            Comment.objects.filter(pk=self.comment.pk).delete()
+            call_command('import_data', path, stdout=io.StringIO())
+        self.assertEqual(
+            list(posts.values(*POST_FIELDS)), expected
+        )
+        self.assertTrue(Comment.objects.filter(pk=self.comment.pk).exists())
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -77,11 +78,12 @@ class PostFormTests(TestCase):
         )
         # Снова проверили количество постов
         self.assertEqual(Post.objects.count(), posts_count + 1)
-        # Проверили, что пост сохранился в бд
+        # Проверили, что пост сохранился в бд под именем по содержимому
+        digest = hashlib.sha256(small_gif).hexdigest()
         self.assertTrue(
             Post.objects.filter(
                 text='Текст поста для теста',
-                image='posts/small.gif'
+                image=f'posts/{digest[:2]}/{digest}.gif'
             ).exists()
         )
 
@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+from collections import Counter
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry,
+                          UserStats)
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+OPTIONS = {
+    'users': 40, 'groups': 3, 'posts': 400, 'comments': 300,
+    'follows': 200, 'images': 2, 'image_size': (32, 24), 'seed': 7,
+    'until': datetime(2021, 6, 1, tzinfo=timezone.utc), 'chunk_size': 150,
+}
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateDataTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def generate(self, **options):
+        call_command('generate_data', stdout=StringIO(), **{
+            **OPTIONS, **options
+        })
+
+    def snapshot(self):
+        return (
+            list(Post.objects.order_by('pk').values_list(
+                'pk', 'author_id', 'group_id', 'text', 'pub_date', 'image'
+            )),
+            list(Comment.objects.order_by('pk').values_list(
+                'post_id', 'author_id', 'created'
+            )),
+            list(Follow.objects.order_by('pk').values_list(
+                'user_id', 'author_id'
+            )),
+        )
+
+    def test_counts_and_distributions(self):
+        """Создается заданное число записей, авторство и подписчики
+        распределены с тяжелым хвостом."""
+        self.generate()
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 400)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(Follow.objects.count(), 200)
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+        posts = sorted(Counter(
+            Post.objects.values_list('author_id', flat=True)
+        ).values(), reverse=True)
+        self.assertGreater(posts[0], 10 * posts[len(posts) // 2])
+        followers = sorted(Counter(
+            Follow.objects.values_list('author_id', flat=True)
+        ).values(), reverse=True)
+        self.assertGreater(followers[0], 4 * followers[len(followers) // 2])
+        images = Post.objects.exclude(image='').exclude(image=None)
+        self.assertEqual(images.count(), 2)
+        self.assertTrue(images[0].image.storage.exists(images[0].image.name))
+
+    def test_side_tables_rebuilt(self):
+        """Счетчики и ленты заполняются после генерации."""
+        self.generate()
+        author = Post.objects.values_list('author_id', flat=True)[0]
+        self.assertEqual(
+            UserStats.objects.get(user_id=author).posts_count,
+            Post.objects.filter(author_id=author).count()
+        )
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(
+                user_id=follow.user_id, author_id=follow.author_id
+            ).count(),
+            Post.objects.filter(author_id=follow.author_id).count()
+        )
+
+    def test_reproducible(self):
+        """Одинаковые seed и until дают одинаковые данные."""
+        self.generate()
+        first = self.snapshot()
+        for model in (Post, Group, User):
+            model.objects.all().delete()
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+        texts = [row[3] for row in first[0]]
+        self.generate(seed=8)
+        self.assertNotEqual(
+            [row[3] for row in self.snapshot()[0][400:]], texts
+        )
@@ -0,0 +1,202 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from PIL import Image
+
+from posts import thumbnails
+from posts.forms import PostForm
+from posts.models import Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+User = get_user_model()
+ORIENTATION = 0x0112
+MAKE = 0x010F
+
+
+def upload(name, size, format_='JPEG', mode='RGB', **options):
+    buffer = BytesIO()
+    Image.new(mode, size, 'orange').save(buffer, format_, **options)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIDE=400,
+    POST_IMAGE_MAX_PIXELS=1_000_000
+)
+class ImageIngestTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Camera')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create(self, image):
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'Снимок', 'image': image,
+        })
+        return Post.objects.get(author=self.user)
+
+    def test_jpeg_capped_rotated_and_stripped(self):
+        """Большой JPEG хранится уменьшенным, повернутым по EXIF
+        и без EXIF."""
+        exif = Image.Exif()
+        exif[ORIENTATION] = 6
+        exif[MAKE] = 'Camera'
+        post = self.create(upload(
+            'photo.jpeg', (1000, 600), exif=exif.tobytes()
+        ))
+        self.assertRegex(post.image.name, r'^posts/\w\w/\w{64}\.jpg$')
+        with Image.open(post.image) as stored:
+            self.assertEqual(stored.format, 'JPEG')
+            self.assertEqual(stored.size, (240, 400))
+            self.assertNotIn('exif', stored.info)
+
+    def test_png_stripped(self):
+        """EXIF из PNG не сохраняется."""
+        exif = Image.Exif()
+        exif[MAKE] = 'SecretCam'
+        post = self.create(upload(
+            'photo.png', (800, 600), 'PNG', exif=exif.tobytes()
+        ))
+        with Image.open(post.image) as stored:
+            self.assertEqual(stored.format, 'PNG')
+            self.assertNotIn('exif', stored.info)
+            self.assertNotIn(MAKE, stored.getexif())
+
+    def test_png_keeps_format_and_alpha(self):
+        post = self.create(upload('logo.png', (800, 800), 'PNG', 'RGBA'))
+        with Image.open(post.image) as stored:
+            self.assertEqual(stored.format, 'PNG')
+            self.assertEqual(stored.mode, 'RGBA')
+            self.assertEqual(stored.size, (400, 400))
+
+    def test_small_gif_stored_as_is(self):
+        """GIF в пределах размера не перекодируется."""
+        image = upload('anim.gif', (20, 10), 'GIF', 'P')
+        content = image.read()
+        image.seek(0)
+        post = self.create(image)
+        self.assertTrue(post.image.name.endswith('.gif'))
+        self.assertEqual(post.image.read(), content)
+
+    def test_large_animated_gif_rejected(self):
+        """Анимированный GIF больше POST_IMAGE_MAX_SIDE отклоняется:
+        после уменьшения от него остался бы первый кадр."""
+        buffer = BytesIO()
+        frames = [Image.new('P', (500, 100), color) for color in (1, 2)]
+        frames[0].save(
+            buffer, 'GIF', save_all=True, append_images=frames[1:]
+        )
+        form = PostForm(
+            data={'text': 'Анимация'},
+            files={'image': SimpleUploadedFile('anim.gif', buffer.getvalue())}
+        )
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code, 'animation_too_large'
+        )
+
+    def test_large_static_gif_stored_as_png(self):
+        """Статичный GIF больше POST_IMAGE_MAX_SIDE хранится в PNG
+        с прозрачностью."""
+        post = self.create(upload('big.gif', (800, 200), 'GIF', 'P',
+                                  transparency=0))
+        self.assertTrue(post.image.name.endswith('.png'))
+        with Image.open(post.image) as stored:
+            self.assertEqual(stored.mode, 'RGBA')
+            self.assertEqual(stored.size, (400, 100))
+
+    def test_invalid_upload_on_edit(self):
+        """Правка с битой картинкой не сохраняется и возвращает форму
+        с ошибкой."""
+        post = Post.objects.create(author=self.user, text='Без картинки')
+        response = self.client.post(
+            reverse('posts:post_edit', args=[post.pk]), {
+                'text': 'Правка',
+                'image': SimpleUploadedFile('broken.jpg', b'not an image'),
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors['image'])
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Без картинки')
+        self.assertFalse(post.image)
+
+    def test_too_many_pixels_rejected(self):
+        """Картинка больше POST_IMAGE_MAX_PIXELS отклоняется."""
+        form = PostForm(
+            data={'text': 'Панорама'},
+            files={'image': upload('wide.jpg', (2000, 600))}
+        )
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code, 'image_too_large'
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SharedImageTests(TransactionTestCase):
+    """Ссылки на картинку снимаются после коммита, поэтому тесты
+    выполняются без общей транзакции TestCase."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Memes')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create(self, text, image):
+        self.client.post(reverse('posts:post_create'), {
+            'text': text, 'image': image,
+        })
+        return Post.objects.get(text=text)
+
+    def test_identical_uploads_share_file_and_thumbnails(self):
+        """Посты с одинаковой картинкой делят файл и миниатюры; файл
+        и миниатюры удаляются вместе с последним из постов."""
+        first = self.create('Первый', upload('meme.png', (60, 40), 'PNG'))
+        second = self.create('Второй', upload('copy.png', (60, 40), 'PNG'))
+        self.assertEqual(first.image.name, second.image.name)
+        call_command('render_thumbnails', stdout=StringIO())
+        thumbnail = thumbnails.lookup(first.image, 'card')
+        self.assertEqual(
+            thumbnail.name, thumbnails.lookup(second.image, 'card').name
+        )
+        storage = first.image.storage
+        first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(storage.exists(second.image.name))
+        self.assertFalse(thumbnail.exists())
+
+    def test_replaced_image_released(self):
+        """Замена картинки снимает ссылку на прежнюю."""
+        post = self.create('Пост', upload('old.png', (60, 40), 'PNG'))
+        old = post.image.name
+        self.client.post(
+            reverse('posts:post_edit', args=[post.pk]),
+            {'text': 'Пост', 'image': upload('new.gif', (60, 40), 'GIF')}
+        )
+        self.assertFalse(post.image.storage.exists(old))
@@ -0,0 +1,172 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from core.models import StoredFile
+from posts.management.commands.import_data import Command, kept_dates
+from posts.models import (Comment, Follow, Group, Mention, Post, PostTag,
+                          TimelineEntry, UserStats)
+
+User = get_user_model()
+
+RECORDS = [
+    {'type': 'user', 'id': 501, 'username': 'legacy_author'},
+    {'type': 'user', 'id': 502, 'username': 'legacy_reader'},
+    {'type': 'group', 'id': 51, 'title': 'Архив', 'slug': 'archive',
+     'description': 'Старые посты'},
+    {'type': 'post', 'id': 701, 'author_id': 501, 'group_id': 51,
+     'text': 'Первый #архив', 'pub_date': '2015-03-01T10:00:00+00:00'},
+    {'type': 'post', 'id': 702, 'author_id': 501,
+     'text': 'Второй для @legacy_reader', 'image': 'posts/legacy.jpg',
+     'pub_date': '2015-03-02T10:00:00+00:00'},
+    {'type': 'comment', 'id': 901, 'post_id': 701, 'author_id': 502,
+     'text': 'Коммент', 'created': '2015-03-03T10:00:00+00:00'},
+    {'type': 'follow', 'user_id': 502, 'author_id': 501},
+]
+
+
+class ImportDataTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write('\n'.join(lines) + '\n')
+        return path
+
+    def jsonl(self):
+        return self.write(
+            'data.jsonl', [json.dumps(record) for record in RECORDS]
+        )
+
+    def test_import_jsonl(self):
+        """Записи сохраняются с датами из файла, отложенная работа
+        выполняется в конце импорта."""
+        out = StringIO()
+        call_command('import_data', self.jsonl(), chunk_size=2, stdout=out)
+        self.assertIn('записей/с', out.getvalue())
+        post = Post.objects.get(pk=701)
+        self.assertEqual(post.group, Group.objects.get(slug='archive'))
+        self.assertEqual(
+            post.pub_date, datetime(2015, 3, 1, 10, tzinfo=timezone.utc)
+        )
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            Comment.objects.get(pk=901).created,
+            datetime(2015, 3, 3, 10, tzinfo=timezone.utc)
+        )
+        self.assertTrue(Follow.objects.filter(user_id=502).exists())
+        self.assertEqual(UserStats.objects.get(user_id=501).posts_count, 2)
+        self.assertEqual(
+            UserStats.objects.get(user_id=501).followers_count, 1
+        )
+        self.assertEqual(
+            UserStats.objects.get(user_id=502).following_count, 1
+        )
+        self.assertEqual(TimelineEntry.objects.filter(user_id=502).count(), 2)
+        self.assertTrue(PostTag.objects.filter(tag='архив').exists())
+        self.assertTrue(Mention.objects.filter(user_id=502).exists())
+        # Картинки импортированных постов учтены в хранилище
+        self.assertEqual(
+            StoredFile.objects.get(name='posts/legacy.jpg').refs, 1
+        )
+        self.assertFalse(User.objects.get(pk=501).has_usable_password())
+        self.assertFalse(os.path.exists(f'{self.jsonl()}.checkpoint'))
+        # Новые посты после импорта создаются с текущей датой
+        self.assertGreater(
+            Post.objects.create(author_id=501, text='Новый').pub_date.year,
+            2015
+        )
+
+    def test_import_csv(self):
+        """CSV с типом из параметра --type."""
+        path = self.write('users.csv', [
+            'id,username,email', '601,csv_user,csv@example.com',
+        ])
+        call_command('import_data', path, type='user', stdout=StringIO())
+        self.assertEqual(User.objects.get(pk=601).username, 'csv_user')
+
+    def test_resume_after_failure(self):
+        """После сбоя импорт продолжается с последней сохраненной пачки."""
+        path = self.jsonl()
+        save = Command.save
+        calls = []
+
+        def failing_save(command, pending):
+            calls.append(len(pending))
+            if len(calls) == 3:
+                raise RuntimeError('сбой')
+            return save(command, pending)
+
+        with mock.patch.object(Command, 'save', failing_save):
+            with self.assertRaises(RuntimeError):
+                call_command(
+                    'import_data', path, chunk_size=2, stdout=StringIO()
+                )
+        self.assertEqual(Post.objects.count(), 1)
+        with open(f'{path}.checkpoint') as stream:
+            self.assertEqual(json.load(stream), {'done': 4})
+        out = StringIO()
+        call_command('import_data', path, chunk_size=2, stdout=out)
+        self.assertIn('Продолжение импорта с записи 5', out.getvalue())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        # Счетчики учитывают и записи, сохраненные до сбоя
+        self.assertEqual(UserStats.objects.get(user_id=501).posts_count, 2)
+        self.assertEqual(TimelineEntry.objects.filter(user_id=502).count(), 2)
+
+    def test_dates_restored_after_failure(self):
+        """После сбоя импорта auto_now_add снова включен, а kept_dates
+        возвращает полям прежние значения."""
+        path = self.write('broken.jsonl', [
+            json.dumps(RECORDS[0]), json.dumps({'type': 'post', 'text': 'x'}),
+        ])
+        with self.assertRaises(CommandError):
+            call_command('import_data', path, stdout=StringIO())
+        field = Post._meta.get_field('pub_date')
+        self.assertTrue(field.auto_now_add)
+        field.auto_now_add = False
+        try:
+            with kept_dates():
+                pass
+            self.assertFalse(field.auto_now_add)
+        finally:
+            field.auto_now_add = True
+
+    def test_batches_within_query_params(self):
+        """Пачки INSERT и id берутся из лимита параметров базы, а не
+        из постоянного размера."""
+        limit = 30
+        batch_sizes = []
+        bulk_create = Post.objects.bulk_create.__func__
+
+        def recording_bulk_create(manager, objs, *args, **kwargs):
+            if manager.model is Post:
+                batch_sizes.append(kwargs['batch_size'])
+            return bulk_create(manager, objs, *args, **kwargs)
+
+        with mock.patch.object(
+            connection.features, 'max_query_params', limit
+        ), mock.patch.object(
+            type(Post.objects), 'bulk_create', recording_bulk_create
+        ):
+            call_command(
+                'import_data', self.jsonl(), batch_size=5000,
+                stdout=StringIO()
+            )
+        self.assertEqual(
+            batch_sizes, [limit // len(Post._meta.concrete_fields)]
+        )
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(UserStats.objects.get(user_id=501).posts_count, 2)
@@ -0,0 +1,109 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from posts.feed import timeline
+from posts.models import (
+    Comment, Follow, Group, Mention, Post, PostTag, TimelineEntry
+)
+from posts.paginators import NEXT, PREVIOUS, CursorPaginator
+
+User = get_user_model()
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент читают строки по индексам в нужном порядке:
+    без полного прохода по таблице и без временной сортировки."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='PlanReader')
+        cls.author = User.objects.create_user(username='PlanAuthor')
+        cls.group = Group.objects.create(
+            title='Группа для планов',
+            slug='plan-slug',
+            description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост для планов'
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def get_plan(self, queryset):
+        sql, params = queryset.query.get_compiler(
+            connection=connection
+        ).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexed(self, queryset):
+        plan = self.get_plan(queryset)
+        for step in plan:
+            self.assertNotIn('TEMP B-TREE', step, plan)
+            if step.startswith('SCAN'):
+                self.assertIn('USING', step, plan)
+
+    def test_feed_queries_use_indexes(self):
+        """Ленты, комментарии и подписки читаются по индексам."""
+        posts = Post.objects.select_related('author', 'group')
+        cursor = CursorPaginator(posts, 10)
+        querysets = {
+            'index': posts[:10],
+            'index_cursor': cursor._ordered(
+                posts, (NEXT, self.post.pub_date, self.post.pk),
+                'pub_date', 'pk'
+            )[:10],
+            'group': posts.filter(group=self.group)[:10],
+            'group_cursor': cursor._ordered(
+                posts.filter(group=self.group),
+                (PREVIOUS, self.post.pub_date, self.post.pk),
+                'pub_date', 'pk'
+            )[:10],
+            'profile': posts.filter(author=self.author)[:10],
+            'comments': Comment.objects.filter(
+                post=self.post
+            ).select_related('author'),
+            'timeline': timeline(self.user).entries[:10],
+            'tag': cursor._ordered(
+                PostTag.objects.filter(tag='тег'),
+                (NEXT, self.post.pub_date, self.post.pk),
+                'pub_date', 'post_id'
+            ).select_related('post__author', 'post__group')[:10],
+            'mentions': cursor._ordered(
+                Mention.objects.filter(user=self.user), None,
+                'pub_date', 'post_id'
+            ).select_related('post__author', 'post__group')[:10],
+            'timeline_author': TimelineEntry.objects.filter(
+                user=self.user, author=self.author
+            ),
+            'followers': Follow.objects.filter(
+                author=self.author
+            ).values_list('user_id', flat=True),
+            'following': Follow.objects.filter(
+                user=self.user
+            ).values_list('author_id', flat=True),
+            'is_following': Follow.objects.filter(
+                user=self.user, author=self.author
+            ),
+        }
+        for name, queryset in querysets.items():
+            with self.subTest(query=name):
+                self.assertIndexed(queryset)
+
+    def test_filtered_feeds_search_index(self):
+        """Ленты группы и автора не проходят весь индекс дат."""
+        posts = Post.objects.all()
+        cases = {
+            'post_group_date_idx': posts.filter(group=self.group)[:10],
+            'post_author_date_idx': posts.filter(author=self.author)[:10],
+        }
+        for index, queryset in cases.items():
+            with self.subTest(index=index):
+                plan = self.get_plan(queryset)
+                self.assertTrue(
+                    any(step.startswith('SEARCH') and index in step
+                        for step in plan),
+                    plan
+                )
@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import LiveServerTestCase, SimpleTestCase
+
+from posts.management.commands.loadtest import (parse_mix, percentile,
+                                                split_clients)
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class LoadTestHelpersTests(SimpleTestCase):
+    def test_percentile(self):
+        """Перцентиль считается по ближайшему рангу."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.95), 7)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_parse_mix(self):
+        self.assertEqual(
+            parse_mix('browse=3,feed'), {'browse': 3.0, 'feed': 1.0}
+        )
+
+    def test_split_clients(self):
+        """Анонимные сценарии выполняют отдельные клиенты без входа,
+        клиенты делятся по весам сценариев."""
+        mix = {'browse': 60, 'feed': 20, 'comment': 10, 'follow': 10}
+        self.assertEqual(split_clients(mix, 8), {
+            False: ({'browse': 60}, 5),
+            True: ({'feed': 20, 'comment': 10, 'follow': 10}, 3),
+        })
+        self.assertEqual(
+            split_clients({'browse': 99, 'feed': 1}, 2),
+            {False: ({'browse': 99}, 1), True: ({'feed': 1}, 1)}
+        )
+        self.assertEqual(
+            split_clients({'feed': 1}, 4), {True: ({'feed': 1}, 4)}
+        )
+        with self.assertRaises(CommandError):
+            split_clients(mix, 1)
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+    def setUp(self):
+        author = User.objects.create_user(username='LoadAuthor')
+        Group.objects.create(
+            title='Группа', slug='load-group', description='Описание'
+        )
+        Post.objects.create(author=author, text='Пост под нагрузкой')
+
+    def test_run_and_report(self):
+        """Каждый сценарий выполняется без ошибок, отчет сохраняется
+        в JSON и сравнивается с прошлым."""
+        endpoints = {
+            'browse': ('posts:index', 'posts:group_list'),
+            'feed': ('users:login', 'posts:follow_index'),
+            'comment': ('users:login', 'posts:add_comment'),
+            'follow': (
+                'users:login', 'posts:profile_follow',
+                'posts:profile_unfollow',
+            ),
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.json')
+            for scenario, names in endpoints.items():
+                # Тестовый сервер делит между потоками одно соединение
+                # с базой в памяти, поэтому клиент один
+                call_command(
+                    'loadtest', url=self.live_server_url, seconds=0,
+                    clients=1, mix={scenario: 1}, output=path,
+                    stdout=StringIO()
+                )
+                with open(path) as stream:
+                    report = json.load(stream)
+                with self.subTest(scenario=scenario):
+                    self.assertEqual(report['total']['errors'], 0)
+                    self.assertCountEqual(report['endpoints'], names)
+                    self.assertIsNotNone(report['total']['p99_ms'])
+            out = StringIO()
+            call_command(
+                'loadtest', url=self.live_server_url, seconds=0,
+                clients=1, mix={'follow': 1}, compare=path, stdout=out
+            )
+        self.assertTrue(Comment.objects.exists())
+        self.assertIn('%)', out.getvalue())
+        # После теста войти под пользователями нагрузки нельзя
+        for user in User.objects.filter(username__startswith='loadtest_'):
+            self.assertFalse(user.is_active)
+            self.assertFalse(user.has_usable_password())
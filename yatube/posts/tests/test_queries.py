@@ -0,0 +1,94 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+POSTS_COUNT = 10
+
+
+class QueryBudgetTest(TestCase):
+    """Количество SQL-запросов страниц не зависит от числа постов,
+    авторов и комментариев на странице."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='BudgetReader')
+        cls.group = Group.objects.create(
+            title='Группа бюджета',
+            slug='budget-group',
+            description='Описание'
+        )
+        for i in range(POSTS_COUNT):
+            author = User.objects.create_user(username=f'BudgetAuthor{i}')
+            group = Group.objects.create(
+                title=f'Группа {i}',
+                slug=f'budget-{i}',
+                description='Описание'
+            )
+            Follow.objects.create(user=cls.reader, author=author)
+            post = Post.objects.create(
+                author=author, group=group, text=f'Пост {i}'
+            )
+            Post.objects.create(
+                author=cls.reader, group=cls.group, text=f'Пост читателя {i}'
+            )
+            Comment.objects.create(
+                post=post, author=author, text=f'Коммент {i}'
+            )
+        cls.post = Post.objects.filter(comments__isnull=False).first()
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=user, text='Еще коммент')
+            for user in User.objects.all()
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_guest_pages_query_budget(self):
+        """Страницы для гостя укладываются в бюджет запросов."""
+        # COUNT для номеров страниц + сами посты с авторами и группами;
+        # группе, профилю и посту нужен еще запрос для ETag
+        budgets = {
+            reverse('posts:index'): 2,
+            reverse('posts:index') + '?cursor=': 1,
+            reverse('posts:group_list', kwargs={
+                'slug': self.group.slug}): 4,
+            reverse('posts:profile', kwargs={
+                'username': self.reader.username}): 4,
+            reverse('posts:post_detail', kwargs={
+                'post_id': self.post.pk}): 3,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(budget):
+                    self.guest_client.get(url)
+
+    def test_authorized_pages_query_budget(self):
+        """Страницы для пользователя укладываются в бюджет запросов."""
+        # К запросам гостя добавляется пользователь, сессия читается
+        # из кэша
+        budgets = {
+            reverse('posts:index'): 3,
+            reverse('posts:follow_index'): 5,
+            reverse('posts:follow_index') + '?cursor=': 4,
+            reverse('posts:profile', kwargs={
+                'username': self.reader.username}): 6,
+            reverse('posts:post_detail', kwargs={
+                'post_id': self.post.pk}): 4,
+            reverse('posts:post_create'): 2,
+            reverse('posts:post_edit', kwargs={
+                'post_id': Post.objects.filter(
+                    author=self.reader).first().pk}): 3,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(budget):
+                    self.authorized_client.get(url)
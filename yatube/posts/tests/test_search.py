@@ -0,0 +1,92 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from posts.models import Comment, Post
+from posts.search import search_comments, search_posts
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='SearchArt')
+        cls.admin = User.objects.create_superuser(
+            username='SearchAdmin', email='admin@example.com',
+            password='password'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Прогулка по осеннему парку'
+        )
+        cls.commented = Post.objects.create(
+            author=cls.user, text='Фотографии без подписи'
+        )
+        cls.comment = Comment.objects.create(
+            post=cls.commented, author=cls.user, text='Красивый парк'
+        )
+        cls.other = Post.objects.create(
+            author=cls.user, text='Рецепт осеннего супа'
+        )
+
+    def search(self, query):
+        response = Client().get(reverse('posts:search'), {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_search_posts_and_comments(self):
+        """Находятся посты по тексту и по комментариям,
+        слова ищутся по началу."""
+        self.assertCountEqual(
+            self.search('парк'), [self.post, self.commented]
+        )
+        self.assertEqual(self.search('осенн прогул'), [self.post])
+        self.assertEqual(self.search('ПАРКУ'), [self.post])
+        self.assertEqual(self.search('"*:-'), [])
+        self.assertEqual(self.search(''), [])
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении текстов."""
+        self.post.text = 'Прогулка по лесу'
+        self.post.save()
+        self.comment.delete()
+        self.assertEqual(self.search('парк'), [])
+        self.assertEqual(self.search('лесу'), [self.post])
+        Post.objects.filter(pk=self.other.pk).update(text='Рецепт пирога')
+        self.assertEqual(self.search('пирог'), [self.other])
+
+    def test_ranking(self):
+        """Более релевантный пост выводится первым."""
+        best = Post.objects.create(
+            author=self.user, text='Парк, парк и еще раз парк'
+        )
+        self.assertEqual(self.search('парк')[0], best)
+
+    def test_pagination_keeps_query(self):
+        """Ссылки пагинатора сохраняют поисковый запрос."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Заметка номер {i}')
+            for i in range(15)
+        )
+        response = Client().get(reverse('posts:search'), {'q': 'заметка'})
+        self.assertEqual(response.context['page_obj'].paginator.count, 15)
+        self.assertContains(response, '?q=%D0%B7%D0%B0%D0%BC%D0%B5%D1%82'
+                                      '%D0%BA%D0%B0&amp;page=2')
+
+    def test_admin_search(self):
+        """Админка ищет посты и комментарии по индексу."""
+        self.assertEqual(
+            list(search_posts(Post.objects.all(), 'суп')), [self.other]
+        )
+        self.assertEqual(
+            list(search_comments(Comment.objects.all(), 'красив')),
+            [self.comment]
+        )
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'прогулка'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.post]
+        )
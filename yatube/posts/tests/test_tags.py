@@ -0,0 +1,109 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from posts.models import Mention, Post, PostTag
+from posts.tags import extract_mentions, extract_tags
+from posts.templatetags.post_markup import markup, mentioned_users
+
+User = get_user_model()
+
+
+class TagIndexTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='TagArt')
+        cls.reader = User.objects.create_user(username='tag.reader')
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_extract(self):
+        """Из текста извлекаются теги и имена пользователей."""
+        text = 'Привет, @tag.reader. #Осень и #осень, a#b, me@mail.ru'
+        self.assertEqual(extract_tags(text), {'осень'})
+        self.assertEqual(extract_mentions(text), {'tag.reader'})
+
+    def test_index_follows_text(self):
+        """Индекс обновляется при создании, правке и удалении поста."""
+        post = Post.objects.create(
+            author=self.author, text='#кот и #пес для @tag.reader @nobody'
+        )
+        self.assertCountEqual(
+            PostTag.objects.filter(post=post).values_list('tag', flat=True),
+            ['кот', 'пес']
+        )
+        self.assertEqual(
+            list(Mention.objects.values_list('post', 'user')),
+            [(post.pk, self.reader.pk)]
+        )
+        post.text = 'Только #кот'
+        post.save()
+        self.assertEqual(
+            list(PostTag.objects.values_list('tag', flat=True)), ['кот']
+        )
+        self.assertFalse(Mention.objects.exists())
+        post.delete()
+        self.assertFalse(PostTag.objects.exists())
+
+    def test_tag_feed_cursor_pagination(self):
+        """Лента тега читается из индекса и листается курсором."""
+        posts = [
+            Post.objects.create(author=self.author, text=f'#Лес пост {i}')
+            for i in range(13)
+        ]
+        Post.objects.create(author=self.author, text='#море')
+        url = reverse('posts:tag_feed', kwargs={'tag': 'лес'})
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url)
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), posts[::-1][:10])
+        response = self.guest_client.get(
+            url, {'cursor': page_obj.next_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']), posts[2::-1])
+
+    def test_mentions_page(self):
+        """Страница упоминаний показывает посты с @username читателя."""
+        post = Post.objects.create(
+            author=self.author, text='Спасибо, @tag.reader!'
+        )
+        Post.objects.create(author=self.author, text='Без упоминаний')
+        response = self.reader_client.get(reverse('posts:mentions'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+        response = self.guest_client.get(reverse('posts:mentions'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_markup(self):
+        """Теги и упоминания в тексте становятся ссылками."""
+        self.assertEqual(
+            markup('<b>#Кот</b> для @tag.reader.', {'tag.reader'}),
+            '&lt;b&gt;<a href="/tags/%D0%BA%D0%BE%D1%82/">#Кот</a>'
+            '&lt;/b&gt; для <a href="/profile/tag.reader/">@tag.reader</a>.'
+        )
+
+    def test_unknown_mention_not_linked(self):
+        """Упоминание несуществующего пользователя остается текстом,
+        имена страницы проверяются одним запросом."""
+        posts = [
+            Post.objects.create(author=self.author, text=text)
+            for text in ('Для @tag.reader', 'Для @nobody', 'Без имен')
+        ]
+        with self.assertNumQueries(1):
+            users = mentioned_users(posts)
+        self.assertEqual(users, {'tag.reader'})
+        self.assertEqual(markup('Для @nobody', users), 'Для @nobody')
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=[posts[1].pk])
+        )
+        self.assertNotContains(response, '/profile/nobody/')
+
+    def test_long_tag_skipped(self):
+        """Слово длиннее поля тега не считается тегом и не обрезается."""
+        text = '#' + 'а' * 101
+        self.assertEqual(extract_tags(text), set())
+        self.assertEqual(markup(text), text)
+        self.assertEqual(extract_tags('#' + 'а' * 100), {'а' * 100})
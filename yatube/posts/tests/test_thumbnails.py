@@ -0,0 +1,217 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from itertools import count
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image, features
+
+from posts import thumbnails
+from posts.models import Post, ThumbnailJob
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+COLORS = count()
+User = get_user_model()
+
+
+def upload(name='picture.jpg'):
+    # Одинаковые картинки хранятся одним файлом с общими миниатюрами,
+    # поэтому каждая загрузка своего цвета; близкие цвета JPEG может
+    # сжать в одинаковые байты, поэтому шаг крупный
+    number = next(COLORS)
+    color = (number % 16 * 16, number // 16 % 16 * 16, 128)
+    buffer = BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create_post(self):
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой', 'image': upload(),
+        })
+        return Post.objects.get(author=self.user)
+
+    def test_upload_queues_without_rendering(self):
+        """Загрузка ставит пост в очередь, страница выводит оригинал
+        и не создает миниатюр."""
+        post = self.create_post()
+        self.assertTrue(ThumbnailJob.objects.filter(post=post).exists())
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        self.assertContains(response, post.image.url)
+        for geometry, options in thumbnails.PRESETS.values():
+            self.assertFalse(thumbnails.backend.thumbnail_file(
+                post.image, geometry, **options
+            ).exists())
+        self.assertIsNone(thumbnails.lookup(post.image, 'detail'))
+
+    def test_worker_renders_presets(self):
+        """Воркер создает миниатюры всех размеров и снимает задание,
+        после чего страницы выводят миниатюру."""
+        post = self.create_post()
+        call_command('render_thumbnails', stdout=StringIO())
+        self.assertFalse(ThumbnailJob.objects.exists())
+        for preset, (geometry, _) in thumbnails.PRESETS.items():
+            with self.subTest(preset=preset):
+                thumbnail = thumbnails.lookup(post.image, preset)
+                self.assertIsNotNone(thumbnail)
+                self.assertEqual(
+                    f'{thumbnail.width}x{thumbnail.height}', geometry
+                )
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        self.assertContains(
+            response, thumbnails.lookup(post.image, 'detail').url
+        )
+        self.assertNotContains(response, post.image.url)
+        response = self.client.get(
+            reverse('posts:profile', args=[self.user.username])
+        )
+        self.assertContains(
+            response, thumbnails.lookup(post.image, 'wide').url
+        )
+
+    def test_source_decoded_once(self):
+        """Воркер декодирует картинку один раз на все варианты."""
+        self.create_post()
+        with mock.patch.object(
+            thumbnails.default.engine, 'get_image',
+            wraps=thumbnails.default.engine.get_image
+        ) as get_image:
+            call_command('render_thumbnails', stdout=StringIO())
+        self.assertEqual(get_image.call_count, 1)
+
+    def test_srcset_of_ready_variants(self):
+        """Страница перечисляет в srcset готовые варианты по ширине."""
+        post = self.create_post()
+        call_command('render_thumbnails', stdout=StringIO())
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        ready = thumbnails.srcsets(post.image, 'detail')[None]
+        self.assertEqual(
+            [width for _, width in ready], [*thumbnails.WIDTHS, 960]
+        )
+        for thumbnail, width in ready:
+            self.assertContains(response, f'{thumbnail.url} {width}w')
+        self.assertContains(response, thumbnails.SIZES['detail'])
+
+    @skipUnless(features.check('webp'), 'Pillow без поддержки WebP')
+    def test_webp_source(self):
+        """Если Pillow умеет WebP, варианты WebP идут отдельным
+        источником перед основным форматом."""
+        post = self.create_post()
+        call_command('render_thumbnails', stdout=StringIO())
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, '.webp 480w')
+
+    def test_webp_source_markup(self):
+        """Готовые варианты WebP выводятся отдельным источником
+        <source type="image/webp"> перед основным форматом."""
+        post = self.create_post()
+        with mock.patch.object(
+            thumbnails.features, 'check', return_value=True
+        ):
+            ready = []
+            for _, width, geometry, options in thumbnails.variants('detail'):
+                thumbnail = thumbnails.backend.thumbnail_file(
+                    post.image, geometry, **options
+                )
+                ready.append(
+                    (thumbnail.name, tuple(map(int, geometry.split('x'))))
+                )
+            thumbnails.register(post.image.name, (64, 48), ready)
+            response = self.client.get(
+                reverse('posts:post_detail', args=[post.pk])
+            )
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, '.webp 480w')
+        content = response.content.decode()
+        self.assertLess(
+            content.index('image/webp'), content.index('<img class')
+        )
+
+    def test_srcsets_looked_up_once(self):
+        """Набор вариантов, готовый или еще нет, кэшируется: повторный
+        вывод не обращается к хранилищу ключей."""
+        post = self.create_post()
+        with mock.patch.object(
+            thumbnails.backend, 'get_ready',
+            wraps=thumbnails.backend.get_ready
+        ) as get_ready:
+            self.assertEqual(thumbnails.srcsets(post.image, 'card'), {})
+            self.assertEqual(thumbnails.srcsets(post.image, 'card'), {})
+        self.assertEqual(
+            get_ready.call_count, len(thumbnails.variants('card'))
+        )
+        call_command('render_thumbnails', stdout=StringIO())
+        self.assertIn(None, thumbnails.srcsets(post.image, 'card'))
+
+    def test_edit_queues_only_new_image(self):
+        """Правка без смены картинки не ставит пост в очередь."""
+        post = self.create_post()
+        ThumbnailJob.objects.all().delete()
+        url = reverse('posts:post_edit', args=[post.pk])
+        self.client.post(url, {'text': 'Новый текст'})
+        self.assertFalse(ThumbnailJob.objects.exists())
+        self.client.post(url, {'text': 'Новый текст', 'image': upload()})
+        self.assertTrue(ThumbnailJob.objects.filter(post=post).exists())
+
+    def test_requeued_job_is_kept(self):
+        """Задание, поставленное заново во время обработки,
+        остается в очереди."""
+        post = self.create_post()
+        job = ThumbnailJob.objects.get(post=post)
+        thumbnails.enqueue(post)
+        thumbnails.process([job])
+        self.assertTrue(ThumbnailJob.objects.filter(post=post).exists())
+
+    def test_failed_job_retried_later(self):
+        """Задание с ошибкой остается в очереди с отложенной попыткой,
+        после MAX_ATTEMPTS неудач снимается."""
+        post = self.create_post()
+        with mock.patch.object(
+            thumbnails, 'render', side_effect=OSError('disk full')
+        ) as render, self.assertLogs(thumbnails.logger, 'ERROR'):
+            call_command('render_thumbnails', stdout=StringIO())
+            job = ThumbnailJob.objects.get(post=post)
+            self.assertEqual(job.attempts, 1)
+            self.assertIn('disk full', job.error)
+            self.assertIsNotNone(job.next_attempt)
+            # Отложенное задание не выбирается повторно
+            call_command('render_thumbnails', stdout=StringIO())
+            self.assertEqual(render.call_count, 1)
+            ThumbnailJob.objects.update(
+                attempts=thumbnails.MAX_ATTEMPTS - 1, next_attempt=None
+            )
+            call_command('render_thumbnails', stdout=StringIO())
+        self.assertFalse(ThumbnailJob.objects.exists())
@@ -2,13 +2,18 @@ import shutil
 import tempfile
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase, override_settings
+from django.db import connection
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 
-from ..models import Post, Group, Comment, Follow
+from ..feed import timeline
+from ..models import Post, Group, Comment, Follow, TimelineEntry
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 User = get_user_model()
@@ -218,6 +223,8 @@ class PaginatorViewsTests(TestCase):
         cls.post_list = Post.objects.bulk_create(cls.post_list)
 
     def setUp(self):
+        # bulk_create не шлет сигналы, поэтому сбросили кэш количества постов
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user2)
@@ -237,6 +244,31 @@ class PaginatorViewsTests(TestCase):
                     reverses_item + '?page=2')
                 self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_pages_cursor_paginator(self):
+        """Курсорная пагинация листает ленты вперед и назад."""
+        reverses_names = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group2.slug}),
+            reverse('posts:profile', kwargs={'username': self.user2.username})
+        ]
+        for reverses_item in reverses_names:
+            with self.subTest(reverses_item=reverses_item):
+                response = self.authorized_client.get(
+                    reverses_item + '?cursor=')
+                first_page = response.context['page_obj']
+                self.assertEqual(len(first_page), 10)
+                self.assertFalse(first_page.has_previous())
+                response = self.authorized_client.get(
+                    reverses_item + f'?cursor={first_page.next_cursor}')
+                second_page = response.context['page_obj']
+                self.assertEqual(len(second_page), 3)
+                self.assertFalse(second_page.has_next())
+                response = self.authorized_client.get(
+                    reverses_item + f'?cursor={second_page.previous_cursor}')
+                self.assertEqual(
+                    list(response.context['page_obj']), list(first_page)
+                )
+
 
 # Тестируем подписки
 class FollowTests(TestCase):
@@ -336,3 +368,222 @@ class FollowTests(TestCase):
             'posts:follow_index'))
         # Проверили, что отобразились посты автора, на которого подписаны
         self.assertNotIn(post, response.context['page_obj'])
+
+    def test_timeline_fan_out_and_trim(self):
+        """Новый пост автора попадает в ленту подписчика,
+        после отписки его посты из ленты убираются."""
+        self.client_user.get(reverse(
+            'posts:profile_follow', kwargs={
+                'username': self.user_author.username}
+        ))
+        # Подписка догрузила в ленту уже опубликованный пост
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user_follower, post=self.post).exists())
+        # Новый пост разложился по лентам подписчиков
+        new_post = Post.objects.create(
+            author=self.user_author,
+            text='Новый пост для ленты'
+        )
+        response = self.client_user.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+        # Отписка очистила ленту
+        self.client_user.get(reverse(
+            'posts:profile_unfollow', kwargs={
+                'username': self.user_author.username}
+        ))
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user_follower).exists())
+
+
+# Тестируем гибридную ленту подписок
+@override_settings(FEED_FANOUT_THRESHOLD=1)
+class HybridFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.follower = User.objects.create_user(username='HybridReader')
+        cls.other_follower = User.objects.create_user(username='HybridFan')
+        # Популярный автор: подписчиков больше порога
+        cls.popular = User.objects.create_user(username='HybridPopular')
+        # Обычный автор
+        cls.regular = User.objects.create_user(username='HybridRegular')
+
+    def setUp(self):
+        Follow.objects.create(user=self.follower, author=self.popular)
+        Follow.objects.create(user=self.other_follower, author=self.popular)
+        Follow.objects.create(user=self.follower, author=self.regular)
+        self.posts = [
+            Post.objects.create(
+                author=self.popular if i % 2 else self.regular,
+                text=f'Гибридный пост {i}'
+            )
+            for i in range(12)
+        ]
+        self.client_user = Client()
+        self.client_user.force_login(self.follower)
+
+    def test_popular_author_is_pulled(self):
+        """Посты популярного автора не раскладываются по лентам."""
+        self.assertFalse(TimelineEntry.objects.filter(
+            author=self.popular).exists())
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.follower, author=self.regular).count(), 6)
+
+    def test_hybrid_feed_merges_sources(self):
+        """Лента сливает записи инбокса и посты популярного автора."""
+        expected = self.posts[::-1]
+        response = self.client_user.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), expected[:10])
+        response = self.client_user.get(
+            reverse('posts:follow_index') + '?page=2')
+        self.assertEqual(list(response.context['page_obj']), expected[10:])
+        response = self.client_user.get(
+            reverse('posts:follow_index') + '?cursor=')
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), expected[:10])
+        response = self.client_user.get(
+            reverse('posts:follow_index') + f'?cursor={page_obj.next_cursor}')
+        self.assertEqual(list(response.context['page_obj']), expected[10:])
+
+    def test_mode_switch_reconciles_timelines(self):
+        """Когда подписчиков становится меньше порога, посты автора,
+        опубликованные без раскладки, догружаются в ленты; при обратном
+        переходе записи ленты убираются."""
+        Follow.objects.filter(
+            user=self.other_follower, author=self.popular
+        ).delete()
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.follower, author=self.popular).count(), 6)
+        response = self.client_user.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), self.posts[::-1][:10]
+        )
+        Follow.objects.create(user=self.other_follower, author=self.popular)
+        self.assertFalse(TimelineEntry.objects.filter(
+            author=self.popular).exists())
+
+    def test_inbox_only_page_reads_its_rows(self):
+        """Без популярных авторов страница ленты читает из инбокса
+        только свои строки, а не все предыдущие."""
+        Follow.objects.filter(
+            user=self.follower, author=self.popular
+        ).delete()
+        feed = timeline(self.follower)
+        self.assertTrue(feed.pulled.query.is_empty())
+        with CaptureQueriesContext(connection) as queries:
+            page = feed[2:4]
+        self.assertEqual(page, self.posts[::-1][1::2][2:4])
+        self.assertEqual(len(queries), 1)
+        self.assertIn('LIMIT 2 OFFSET 2', queries[0]['sql'])
+
+
+# Тестируем кэширование количества постов
+class CachedCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='CountArt')
+        cls.group = Group.objects.create(
+            title='Группа для счетчика',
+            slug='count-slug',
+            description='Описание'
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа для счетчика',
+            slug='count-slug-other',
+            description='Описание'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user, group=self.group, text='Пост для счетчика'
+        )
+
+    def get_count(self, url):
+        return self.client.get(url).context['page_obj'].paginator.count
+
+    def test_count_is_cached_and_invalidated(self):
+        """Количество постов берется из кэша и сбрасывается
+        при сохранении и удалении постов."""
+        group_url = reverse('posts:group_list', kwargs={
+            'slug': self.group.slug})
+        other_url = reverse('posts:group_list', kwargs={
+            'slug': self.other_group.slug})
+        self.assertEqual(self.get_count(group_url), 1)
+        self.assertEqual(self.get_count(other_url), 0)
+        # Повторно запрашивается только группа (для ETag и для страницы):
+        # количество постов и сам фрагмент ленты берутся из кэша
+        with self.assertNumQueries(2):
+            self.client.get(group_url)
+        # Перенос поста в другую группу сбрасывает обе ленты
+        self.post.group = self.other_group
+        self.post.save()
+        self.assertEqual(self.get_count(group_url), 0)
+        self.assertEqual(self.get_count(other_url), 1)
+        self.post.delete()
+        self.assertEqual(self.get_count(reverse('posts:index')), 0)
+
+    @override_settings(POSTS_COUNT_ESTIMATE_THRESHOLD=0)
+    def test_count_estimate(self):
+        """Для огромной таблицы количество оценивается по id."""
+        self.assertEqual(
+            self.get_count(reverse('posts:index')),
+            Post.objects.latest('pk').pk
+        )
+
+
+# Тестируем условные GET-запросы
+class ConditionalGetTests(TransactionTestCase):
+    """Поколения зависимостей меняются после коммита, поэтому тесты
+    выполняются без общей транзакции TestCase."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='EtagArt')
+        self.group = Group.objects.create(
+            title='Группа для ETag',
+            slug='etag-slug',
+            description='Описание'
+        )
+        self.post = Post.objects.create(
+            author=self.user, group=self.group, text='Пост для ETag'
+        )
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_not_modified(self):
+        """Повторный запрос с тем же ETag получает 304,
+        после изменения данных - новую страницу."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                # Другой пользователь видит другую страницу
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный пост для ETag'
+        post.save()
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_comment_changes_post_etag(self):
+        """Новый комментарий меняет ETag страницы поста."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Коммент для ETag'
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,299 @@
+"""Миниатюры картинок постов, создаваемые заранее.
+
+Размеры, в которых картинки выводятся на страницах, перечислены
+в PRESETS; для srcset у каждого размера есть варианты уже (WIDTHS)
+и, если Pillow поддерживает WebP, те же варианты в WebP. При
+сохранении картинки пост ставится в очередь (ThumbnailJob), команда
+render_thumbnails создает все варианты вне запроса (неудачная попытка
+повторяется с растущей паузой, после MAX_ATTEMPTS задание снимается).
+Шаблоны только ищут готовые миниатюры в хранилище ключей sorl-thumbnail
+и, пока их нет, выводят оригинал: декодирование и уменьшение картинок
+не задерживает ответ. Набор готовых вариантов картинки кэшируется
+одним ключом, поэтому страница ищет его одним чтением кэша; пока
+готовы не все варианты, набор хранится PENDING_TIMEOUT секунд.
+"""
+
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import ImageFile
+
+from core.generations import bump
+from .models import Post, ThumbnailJob
+from .signals import post_feeds
+
+logger = logging.getLogger(__name__)
+
+# Имя: (геометрия, параметры sorl-thumbnail)
+PRESETS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'wide': ('1060x339', {'crop': 'center', 'upscale': True}),
+    'detail': ('960x939', {'crop': 'center', 'upscale': True}),
+}
+# Атрибут sizes: ширина картинки в верстке страниц
+SIZES = {
+    'card': '(max-width: 991px) 100vw, 960px',
+    'wide': '(max-width: 1199px) 100vw, 1060px',
+    'detail': '(max-width: 767px) 100vw, 75vw',
+}
+# Ширины уменьшенных вариантов; полная ширина размера есть всегда
+WIDTHS = (480, 768)
+# Сколько секунд хранится набор готовых вариантов картинки: полный
+# и неполный (миниатюры еще создаются)
+READY_TIMEOUT = 24 * 60 * 60
+PENDING_TIMEOUT = 60
+# Сколько раз пытаться создать миниатюры; пауза перед повторной
+# попыткой RETRY_DELAY секунд, удваивается с каждой неудачей
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 60
+# Хранилище картинок постов: по имени картинки без поля (например,
+# в процессах backfill_thumbnails) источник и ключи миниатюр те же
+SOURCE_STORAGE = Post._meta.get_field('image').storage
+
+
+class PresetBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который умеет искать миниатюру, не создавая
+    ее."""
+
+    def prepare(self, file_, geometry_string, **options):
+        """Исходник, миниатюра и параметры, дополненные так же, как
+        в get_thumbnail. Файла миниатюры может еще не быть."""
+        source = ImageFile(file_, getattr(file_, 'storage', SOURCE_STORAGE))
+        if settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return source, ImageFile(name, default.storage), options
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Миниатюра с тем же именем, что дает get_thumbnail."""
+        return self.prepare(file_, geometry_string, **options)[1]
+
+    def get_ready(self, file_, geometry_string, **options):
+        """Готовая миниатюра или None."""
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options)
+        )
+
+
+backend = PresetBackend()
+
+
+def formats():
+    """Форматы вариантов: None - основной формат THUMBNAIL_FORMAT,
+    в котором миниатюра есть всегда; WebP только если Pillow собран
+    с libwebp."""
+    return ('WEBP', None) if features.check('webp') else (None,)
+
+
+def variants(preset):
+    """Варианты размера для srcset: (формат, ширина, геометрия,
+    параметры), по форматам от узких к широким."""
+    geometry, options = PRESETS[preset]
+    width, height = map(int, geometry.split('x'))
+    result = []
+    for format_ in formats():
+        for variant in (*(w for w in WIDTHS if w < width), width):
+            variant_options = dict(options)
+            if format_:
+                variant_options['format'] = format_
+            result.append((
+                format_, variant,
+                f'{variant}x{round(height * variant / width)}',
+                variant_options,
+            ))
+    return result
+
+
+def all_variants():
+    for preset in PRESETS:
+        yield from variants(preset)
+
+
+def lookup(image, preset):
+    """Готовая миниатюра картинки или None, если она еще не создана."""
+    if not image:
+        return None
+    geometry, options = PRESETS[preset]
+    return backend.get_ready(image, geometry, **options)
+
+
+def srcsets_key(name, preset):
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return f'thumbnails:srcsets:{preset}:{digest}'
+
+
+def forget(name):
+    """Сбрасывает закэшированные наборы вариантов картинки."""
+    cache.delete_many([srcsets_key(name, preset) for preset in PRESETS])
+
+
+def srcsets(image, preset):
+    """Готовые варианты картинки: {формат: [(миниатюра, ширина)]}.
+
+    Еще не созданные варианты пропускаются; формата нет в словаре,
+    если готовых вариантов в нем нет.
+    """
+    result = {}
+    if not image:
+        return result
+    key = srcsets_key(image.name, preset)
+    ready = cache.get(key)
+    if ready is None:
+        ready = []
+        expected = variants(preset)
+        for format_, width, geometry, options in expected:
+            thumbnail = backend.get_ready(image, geometry, **options)
+            if thumbnail:
+                ready.append((format_, thumbnail.name, width))
+        cache.set(key, ready, (
+            READY_TIMEOUT if len(ready) == len(expected) else PENDING_TIMEOUT
+        ))
+    for format_, name, width in ready:
+        result.setdefault(format_, []).append(
+            (ImageFile(name, default.storage), width)
+        )
+    return result
+
+
+def is_ready(image):
+    """Созданы ли все варианты картинки."""
+    return all(
+        backend.get_ready(image, geometry, **options)
+        for _, _, geometry, options in all_variants()
+    )
+
+
+def render_missing(name):
+    """Создает недостающие файлы всех вариантов миниатюр картинки,
+    декодируя ее не больше одного раза.
+
+    Хранилище ключей не используется, поэтому функцию можно вызывать
+    в дочерних процессах; результат (имя и размер картинки, имена
+    и размеры миниатюр, число созданных) записывается функцией register.
+    """
+    source_image = source_size = None
+    ready = []
+    created = 0
+    try:
+        for _, _, geometry, options in all_variants():
+            source, thumbnail, options = backend.prepare(
+                name, geometry, **options
+            )
+            if thumbnail.exists():
+                thumbnail.set_size()
+            else:
+                if source_image is None:
+                    source_image = default.engine.get_image(source)
+                    source_size = default.engine.get_image_size(
+                        source_image
+                    )
+                options['image_info'] = default.engine.get_image_info(
+                    source_image
+                )
+                backend._create_thumbnail(
+                    source_image, geometry, options, thumbnail
+                )
+                backend._create_alternative_resolutions(
+                    source_image, geometry, options, thumbnail.name
+                )
+                created += 1
+            ready.append((thumbnail.name, thumbnail.size))
+    finally:
+        if source_image is not None:
+            default.engine.cleanup(source_image)
+    if source_size is None:
+        source.set_size()
+        source_size = source.size
+    return name, source_size, ready, created
+
+
+def register(name, size, ready):
+    """Записывает в хранилище ключей картинку и ее готовые миниатюры."""
+    source = ImageFile(name, SOURCE_STORAGE)
+    source.set_size(size)
+    default.kvstore.get_or_set(source)
+    for thumbnail_name, thumbnail_size in ready:
+        thumbnail = ImageFile(thumbnail_name, default.storage)
+        thumbnail.set_size(thumbnail_size)
+        default.kvstore.set(thumbnail, source)
+
+
+def render(image):
+    """Создает недостающие варианты миниатюр картинки, декодируя ее
+    один раз, и записывает их в хранилище ключей."""
+    name, size, ready, _ = render_missing(image.name)
+    register(name, size, ready)
+
+
+def enqueue(post):
+    """Ставит картинку поста в очередь; повторная постановка только
+    обновляет время в очереди."""
+    ThumbnailJob(post=post).save()
+    forget(post.image.name)
+
+
+def due_jobs():
+    """Задания, которые пора обрабатывать."""
+    return ThumbnailJob.objects.filter(
+        Q(next_attempt__isnull=True) | Q(next_attempt__lte=timezone.now())
+    )
+
+
+def fail(job, error):
+    """Откладывает задание после неудачи или снимает его, если
+    попытки кончились."""
+    attempts = job.attempts + 1
+    # Задание, поставленное заново во время обработки, не трогаем
+    jobs = ThumbnailJob.objects.filter(pk=job.pk, queued=job.queued)
+    if attempts >= MAX_ATTEMPTS:
+        logger.error(
+            'Миниатюры поста %s не созданы за %s попыток, задание снято: %s',
+            job.pk, attempts, error
+        )
+        jobs.delete()
+        return
+    jobs.update(
+        attempts=attempts,
+        error=f'{type(error).__name__}: {error}',
+        next_attempt=timezone.now() + timedelta(
+            seconds=RETRY_DELAY * 2 ** (attempts - 1)
+        ),
+    )
+
+
+def process(jobs):
+    """Создает миниатюры для заданий очереди, возвращает число
+    обработанных."""
+    done = 0
+    for job in jobs:
+        post = job.post
+        if post.image:
+            try:
+                render(post.image)
+            except Exception as error:
+                logger.exception('Миниатюры поста %s не созданы', post.pk)
+                fail(job, error)
+                continue
+            # Закэшированные фрагменты лент выводят оригинал
+            forget(post.image.name)
+            bump(*post_feeds(post), f'post:{post.pk}')
+        # Если картинку сменили во время обработки, время в очереди
+        # обновилось и задание остается для нового файла
+        ThumbnailJob.objects.filter(pk=job.pk, queued=job.queued).delete()
+        done += 1
+    return done
@@ -15,6 +15,13 @@ urlpatterns = [
         'posts/<int:post_id>/comment/', views.add_comment, name='add_comment'
     ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
+    path('tags/<str:tag>/', views.tag_feed, name='tag_feed'),
+    path('mentions/', views.mentions, name='mentions'),
+    path(
+        'profile/<str:username>/export/',
+        views.profile_export, name='profile_export'
+    ),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow, name='profile_follow'
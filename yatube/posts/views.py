@@ -1,16 +1,33 @@
+from urllib.parse import urlencode
+
 from django.core.paginator import Paginator
+from django.db import router
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 
-from .models import Post, Group, User, Comment, Follow
+from .models import Post, Group, User, Comment, Follow, Mention, PostTag
 from .forms import PostForm, CommentForm
+from .paginators import (
+    paginate, CachedCountPaginator, EntryCursorPaginator,
+    TimelineCursorPaginator, POSTS_PER_PAGE
+)
+from .feed import timeline
+from .counters import get_stats
+from .search import SearchResults
+from . import etags, export, thumbnails
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import condition
+from core.db.replicas import use_replica
 
 
+@use_replica
+@condition(etag_func=etags.index_etag)
 def index(request):
-    posts = Post.objects.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = Post.objects.select_related('author', 'group')
+    page_obj = paginate(
+        request, posts,
+        paginator_class=CachedCountPaginator, feed='global', estimate=True
+    )
     title = 'Последние обновления на сайте'
     text = 'Последние обновления на сайте'
     context = {
@@ -21,12 +38,15 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@use_replica
+@condition(etag_func=etags.group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = group.posts.select_related('author', 'group')
+    page_obj = paginate(
+        request, posts,
+        paginator_class=CachedCountPaginator, feed=f'group:{group.pk}'
+    )
     title = (f'Записи сообщества {group.title}')
     context = {
         'group': group,
@@ -36,13 +56,19 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@use_replica
+@condition(etag_func=etags.profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    posts = author.posts.select_related('author', 'group')
+    page_obj = paginate(
+        request, posts,
+        paginator_class=CachedCountPaginator, feed=f'author:{author.pk}'
+    )
     title = (f'Профайл пользователя {username}')
+    stats = get_stats(author)
     following = False
     if request.user.is_authenticated:
         following = Follow.objects.filter(
@@ -53,19 +79,26 @@ def profile(request, username):
         'title': title,
         'page_obj': page_obj,
         'author': author,
+        'stats': stats,
         'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@use_replica
+@condition(etag_func=etags.post_etag)
 def post_detail(request, post_id):
-    posts = get_object_or_404(Post, pk=post_id)
+    posts = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
     title = (f'Пост: {posts.text[:30]}')
     author = posts.author
-    posts_count = author.posts.all().count()
+    posts_count = get_stats(author).posts_count
     group = posts.group
     form = CommentForm()
-    comments = Comment.objects.filter(post_id=post_id)
+    comments = Comment.objects.filter(
+        post_id=post_id
+    ).select_related('author')
     context = {
         'posts': posts,
         'title': title,
@@ -78,6 +111,20 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@use_replica
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(SearchResults(query), POSTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+        'page_query': urlencode({'q': query}) + '&',
+        'title': f'Поиск: {query}' if query else 'Поиск',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -89,6 +136,8 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            thumbnails.enqueue(post)
         return redirect('posts:profile', username=request.user)
     context = {
         'form': form,
@@ -100,7 +149,9 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     is_edit = True
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author'), pk=post_id
+    )
     author = post.author
     groups = Group.objects.all()
     form = PostForm(request.POST or None, instance=post)
@@ -111,8 +162,10 @@ def post_edit(request, post_id):
         files=request.FILES or None,
         instance=post
     )
-    if request.method == 'POST' and form.is_valid:
+    if request.method == 'POST' and form.is_valid():
         post = form.save()
+        if post.image and 'image' in form.changed_data:
+            thumbnails.enqueue(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -135,18 +188,68 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@use_replica
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(
+        request,
+        timeline(request.user),
+        cursor_paginator_class=TimelineCursorPaginator,
+    )
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/follow.html', context)
 
 
+@use_replica
+def tag_feed(request, tag):
+    entries = PostTag.objects.filter(tag=tag.lower()).select_related(
+        'post__author', 'post__group'
+    )
+    paginator = EntryCursorPaginator(entries, POSTS_PER_PAGE)
+    context = {
+        'page_obj': paginator.get_page(request.GET.get('cursor')),
+        'tag': tag.lower(),
+    }
+    return render(request, 'posts/tag.html', context)
+
+
+@use_replica
+@login_required
+def mentions(request):
+    entries = Mention.objects.filter(user=request.user).select_related(
+        'post__author', 'post__group'
+    )
+    paginator = EntryCursorPaginator(entries, POSTS_PER_PAGE)
+    context = {
+        'page_obj': paginator.get_page(request.GET.get('cursor')),
+    }
+    return render(request, 'posts/mentions.html', context)
+
+
+@use_replica
+@login_required
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        return redirect('posts:profile', username)
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format not in export.FORMATS:
+        raise Http404
+    # База выбирается сейчас: ответ читается уже после выхода
+    # из представления
+    records = export.export_records(author, using=router.db_for_read(Post))
+    response = StreamingHttpResponse(
+        export.render(records, export_format),
+        content_type=export.FORMATS[export_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{username}.{export_format}"'
+    )
+    return response
+
+
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
@@ -10,11 +10,24 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Данные, которые процессы сайта создают во время работы (файл кэша,
+# метрики воркеров); каталог доступен только пользователю сайта.
+# Тесты получают свой временный каталог и не трогают данные сайта.
+VAR_DIR = os.path.join(BASE_DIR, 'var')
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+if TESTING:
+    VAR_DIR = tempfile.mkdtemp(prefix='yatube-test-')
+    atexit.register(shutil.rmtree, VAR_DIR, ignore_errors=True)
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
@@ -56,7 +69,9 @@ INSTALLED_APPS = [
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.db.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,7 +90,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -98,11 +113,36 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # sqlite3 с WAL, настроенными PRAGMA и BEGIN IMMEDIATE
+        # (см. core/db/sqlite3/base.py)
+        'ENGINE': 'core.db.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Копия основной базы для чтения, обновляется командой
+    # sync_replicas (SQLite backup API)
+    'replica': {
+        'ENGINE': 'core.db.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['core.db.replicas.ReplicaRouter']
+
+# Базы, с которых читают страницы, помеченные use_replica
+DATABASE_REPLICAS = ['replica']
+
+# Сколько секунд после записи клиент читает с основной базы;
+# должно превышать интервал синхронизации реплик.
+REPLICA_PIN_SECONDS = 15
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -144,6 +184,12 @@ USE_TZ = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загруженные картинки постов уменьшаются до этой стороны
+# (см. posts/images.py); картинки больше POST_IMAGE_MAX_PIXELS
+# отклоняются без декодирования
+POST_IMAGE_MAX_SIDE = 2048
+POST_IMAGE_MAX_PIXELS = 50_000_000
+
 STATIC_URL = '/static/'
 
 LOGIN_URL = 'users:login'
@@ -157,8 +203,41 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 
+# Режим пагинации лент: 'offset' (номера страниц) или 'cursor'
+# (по ключу (pub_date, id), без COUNT и OFFSET).
+POSTS_PAGINATION_MODE = 'offset'
+
+# Если в ленте всех постов больше строк, чем порог, ее длина
+# оценивается по максимальному id вместо COUNT(*). None отключает оценку.
+POSTS_COUNT_ESTIMATE_THRESHOLD = None
+
+# Посты авторов, у которых подписчиков больше порога, не раскладываются
+# по лентам при публикации, а подмешиваются в ленту при чтении.
+# None отключает гибридный режим. Режим записывается для автора при
+# смене числа подписчиков; после смены порога выполните rebuild_counters.
+FEED_FANOUT_THRESHOLD = 10000
+
+
+# Кэш в общем для воркеров файле в памяти: инвалидация фрагментов
+# видна всем процессам, копия данных одна на хост.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.MmapCache',
+        'LOCATION': os.path.join(VAR_DIR, 'cache', 'default'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 4096,
+            'SLOT_SIZE': 32768,
+        },
     }
 }
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
+# Метрики запросов (core.metrics): агрегаты воркеров в METRICS_DIR,
+# /metrics/ отдает их Prometheus с адресов METRICS_ALLOWED_IPS.
+# За обратным прокси все запросы приходят с его адреса, тогда
+# нужен еще METRICS_TOKEN (заголовок Authorization: Bearer <token>).
+METRICS_DIR = os.path.join(VAR_DIR, 'metrics')
+METRICS_ALLOWED_IPS = INTERNAL_IPS
+METRICS_TOKEN = None